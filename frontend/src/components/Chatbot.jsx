@@ -2,6 +2,18 @@ import React, { useState, useRef, useEffect } from 'react';
 import axios from 'axios';
 import './Chatbot.css';
 
+const API_BASE_URL = 'http://localhost:8000';
+
+const parseSseEvent = (raw) => {
+  let event = 'message';
+  let data = '';
+  raw.split('\n').forEach((line) => {
+    if (line.startsWith('event:')) event = line.slice(6).trim();
+    else if (line.startsWith('data:')) data += line.slice(5).trim();
+  });
+  return { event, data: data ? JSON.parse(data) : {} };
+};
+
 const LoadingIndicator = () => (
   <div className="loading-indicator">
     <div className="loading-dots">
@@ -47,6 +59,7 @@ const Chatbot = () => {
   const messagesEndRef = useRef(null);
   const mediaRecorderRef = useRef(null);
   const audioChunksRef = useRef([]);
+  const abortRef = useRef(null);
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
@@ -56,6 +69,9 @@ const Chatbot = () => {
     scrollToBottom();
   }, [messages]);
 
+  // Closing the chat drops the connection, which stops generation on the server
+  useEffect(() => () => abortRef.current?.abort(), []);
+
   const handleSend = async (text) => {
     if (!text.trim()) return;
 
@@ -64,17 +80,66 @@ const Chatbot = () => {
     setInput('');
     setIsProcessing(true);
 
-    try {
-      const response = await axios.post('http://localhost:8000/agent/chat', {
-        message: text
+    // The reply is streamed as Server-Sent Events so tokens show up as soon as they are generated
+    const updateBotMessage = (text, append) => {
+      setMessages((prev) => {
+        const last = prev[prev.length - 1];
+        if (last && last.sender === 'bot' && last.streaming) {
+          const updated = { ...last, text: append ? last.text + text : text };
+          return [...prev.slice(0, -1), updated];
+        }
+        return [...prev, { text, sender: 'bot', streaming: true }];
       });
+    };
 
-      const botMessage = { text: response.data.response, sender: 'bot' };
-      setMessages((prev) => [...prev, botMessage]);
+    const controller = new AbortController();
+    abortRef.current = controller;
+    try {
+      const response = await fetch(`${API_BASE_URL}/agent/chat/stream`, {
+        method: 'POST',
+        signal: controller.signal,
+        headers: {
+          'Content-Type': 'application/json',
+          'Authorization': `Bearer ${localStorage.getItem('token')}`
+        },
+        body: JSON.stringify({ message: text })
+      });
+      if (!response.ok) {
+        throw new Error(`Chat request failed with status ${response.status}`);
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let finished = false;
+      while (!finished) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const raw of events) {
+          const { event, data } = parseSseEvent(raw);
+          setIsProcessing(false);
+          if (event === 'token') {
+            updateBotMessage(data.text, true);
+          } else if (event === 'message') {
+            updateBotMessage(data.text, false);
+            finished = true;
+          } else if (event === 'error') {
+            throw new Error(data.detail);
+          } else if (event === 'done') {
+            finished = true;
+          }
+        }
+      }
+      // Mark the reply complete so the next one starts a new bubble
+      setMessages((prev) => prev.map((m) => (m.streaming ? { ...m, streaming: false } : m)));
     } catch (error) {
+      if (error.name === 'AbortError') return;
       console.error('Error sending message:', error);
       const errorMessage = { text: 'Sorry, I encountered an error. Please try again.', sender: 'bot' };
-      setMessages((prev) => [...prev, errorMessage]);
+      setMessages((prev) => [...prev.map((m) => (m.streaming ? { ...m, streaming: false } : m)), errorMessage]);
     } finally {
       setIsProcessing(false);
     }
@@ -108,7 +173,10 @@ const Chatbot = () => {
           }
         } catch (error) {
           console.error('Error transcribing audio:', error);
-          const errorMessage = { text: 'Sorry, there was an error processing your voice input. Please try again.', sender: 'bot' };
+          const text = error.response?.status === 422
+            ? "I didn't hear anything. Please try speaking again."
+            : 'Sorry, there was an error processing your voice input. Please try again.';
+          const errorMessage = { text, sender: 'bot' };
           setMessages((prev) => [...prev, errorMessage]);
         } finally {
           setIsProcessing(false);
@@ -0,0 +1,128 @@
+import os
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import FrozenSet, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from ..metrics import metrics
+from ..models.appointment import Appointment
+from .booking import overlap_criteria
+
+
+def _clock(value: str) -> time:
+    return datetime.strptime(value, "%H:%M").time()
+
+
+# Working hours every doctor is bookable in, and the length of one bookable slot
+AVAILABILITY_DAY_START = _clock(os.getenv("AVAILABILITY_DAY_START", "09:00"))
+AVAILABILITY_DAY_END = _clock(os.getenv("AVAILABILITY_DAY_END", "17:00"))
+AVAILABILITY_SLOT_MINUTES = int(os.getenv("AVAILABILITY_SLOT_MINUTES", "30"))
+# Weekday numbers (Monday is 0) with working hours
+AVAILABILITY_WORKING_DAYS = frozenset(int(d) for d in os.getenv("AVAILABILITY_WORKING_DAYS", "0,1,2,3,4").split(",") if d.strip())
+# Longest date range one availability request may cover
+AVAILABILITY_MAX_DAYS = int(os.getenv("AVAILABILITY_MAX_DAYS", "31"))
+# Most slots one availability request may return
+AVAILABILITY_MAX_SLOTS = int(os.getenv("AVAILABILITY_MAX_SLOTS", "500"))
+
+
+@dataclass(frozen=True)
+class WorkingHours:
+    start: time = AVAILABILITY_DAY_START
+    end: time = AVAILABILITY_DAY_END
+    slot_minutes: int = AVAILABILITY_SLOT_MINUTES
+    weekdays: FrozenSet[int] = AVAILABILITY_WORKING_DAYS
+
+    @property
+    def slot(self) -> timedelta:
+        return timedelta(minutes=self.slot_minutes)
+
+    def windows(self, start: datetime, end: datetime) -> Iterable[Tuple[datetime, datetime]]:
+        """Working periods of each day between start and end, in order, clipped to the range"""
+        day = start.date()
+        while datetime.combine(day, self.start) < end:
+            if day.weekday() in self.weekdays:
+                opens, closes = datetime.combine(day, self.start), datetime.combine(day, self.end)
+                if closes > start:
+                    yield max(opens, start), min(closes, end)
+            day += timedelta(days=1)
+
+
+@dataclass(frozen=True)
+class Slot:
+    start: datetime
+    end: datetime
+
+
+def busy_intervals(db: Session, doctor_id: int, start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+    """
+    A doctor's booked intervals overlapping [start, end), in one query served by the
+    (doctor_id, start_time, end_time) index. The predicate is the booking service's
+    overlap check, so every slot computed from these can actually be booked.
+    """
+    metrics.incr("availability_queries_total")
+    return db.query(Appointment.start_time, Appointment.end_time).filter(
+        *overlap_criteria(doctor_id, start, end)
+    ).order_by(Appointment.start_time).all()
+
+
+def _merge(busy: Iterable[Tuple[datetime, datetime]]) -> List[Tuple[datetime, datetime]]:
+    merged: List[Tuple[datetime, datetime]] = []
+    for start, end in sorted(busy):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def free_slots(busy: Iterable[Tuple[datetime, datetime]], start: datetime, end: datetime,
+               hours: Optional[WorkingHours] = None, limit: Optional[int] = None) -> List[Slot]:
+    """
+    Sweep the working windows and the merged busy intervals together, both in time
+    order, and return the slot-length gaps between them. Slots sit on the grid that
+    starts at the opening time, so offers read 9:00, 9:30, ... rather than 9:47.
+    """
+    if limit is not None and limit <= 0:
+        return []
+    hours = hours or WorkingHours()
+    step = hours.slot
+    busy = _merge(busy)
+    slots: List[Slot] = []
+    i = 0
+    for opens, closes in hours.windows(start, end):
+        grid = datetime.combine(opens.date(), hours.start)
+        cursor = opens
+        while True:
+            # Round up onto the slot grid
+            offset = (cursor - grid) % step
+            if offset:
+                cursor += step - offset
+            if cursor + step > closes:
+                break
+            while i < len(busy) and busy[i][1] <= cursor:
+                i += 1
+            if i < len(busy) and busy[i][0] < cursor + step:
+                cursor = busy[i][1]
+                continue
+            slots.append(Slot(cursor, cursor + step))
+            if limit is not None and len(slots) >= limit:
+                return slots
+            cursor += step
+    return slots
+
+
+def find_availability(db: Session, doctor_id: int, start: datetime, end: datetime,
+                      hours: Optional[WorkingHours] = None, limit: Optional[int] = None,
+                      now: Optional[datetime] = None) -> List[Slot]:
+    """Free slots of a doctor between start and end; never earlier than now"""
+    now = now or datetime.now()
+    start = max(start, now)
+    if start >= end:
+        return []
+    return free_slots(busy_intervals(db, doctor_id, start, end), start, end, hours, limit)
+
+
+def day_range(first: date, last: date) -> Tuple[datetime, datetime]:
+    """The datetime range covering whole days first..last inclusive"""
+    return datetime.combine(first, time.min), datetime.combine(last + timedelta(days=1), time.min)
@@ -0,0 +1,169 @@
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from ..metrics import metrics
+from ..models.appointment import Appointment, AppointmentStatus
+from ..models.doctor import Doctor
+from ..tracing import record
+
+logger = logging.getLogger(__name__)
+
+# Attempts after a lock timeout or deadlock before the booking is given up as busy
+BOOKING_MAX_RETRIES = int(os.getenv("BOOKING_MAX_RETRIES", "3"))
+# Backoff before retry n is about BASE * 2^n ms (with jitter), capped at MAX
+BOOKING_BACKOFF_BASE_MS = float(os.getenv("BOOKING_BACKOFF_BASE_MS", "20"))
+BOOKING_BACKOFF_MAX_MS = float(os.getenv("BOOKING_BACKOFF_MAX_MS", "500"))
+# Longest wait for another booking of the same doctor in this process
+BOOKING_LOCK_TIMEOUT_SECONDS = float(os.getenv("BOOKING_LOCK_TIMEOUT_SECONDS", "5"))
+
+
+class BookingError(Exception):
+    """Base class of the booking service's errors; the message is meant for the patient"""
+
+
+class DoctorNotFound(BookingError):
+    def __init__(self, doctor_id: int):
+        self.doctor_id = doctor_id
+        super().__init__(f"Doctor {doctor_id} not found")
+
+
+class SlotUnavailable(BookingError):
+    def __init__(self, conflict_id: int):
+        self.conflict_id = conflict_id
+        super().__init__("The doctor is not available at that time. Please choose another slot.")
+
+
+class BookingBusy(BookingError):
+    def __init__(self):
+        super().__init__("The schedule is busy right now. Please try again shortly.")
+
+
+def overlap_criteria(doctor_id: int, start: datetime, end: datetime):
+    """Filter for a doctor's appointments that overlap [start, end); cancelled ones free their slot"""
+    return (Appointment.doctor_id == doctor_id, Appointment.start_time < end, Appointment.end_time > start,
+            Appointment.status != AppointmentStatus.CANCELLED)
+
+
+_doctor_locks: Dict[int, threading.Lock] = {}
+_doctor_locks_guard = threading.Lock()
+
+
+def _doctor_lock(doctor_id: int) -> threading.Lock:
+    with _doctor_locks_guard:
+        return _doctor_locks.setdefault(doctor_id, threading.Lock())
+
+
+def _backoff(attempt: int) -> float:
+    delay = min(BOOKING_BACKOFF_MAX_MS, BOOKING_BACKOFF_BASE_MS * 2 ** attempt) / 1000
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _write(db: Session, doctor_id: int, start: datetime, end: datetime, exclude_id: Optional[int],
+           apply: Callable[[], Appointment]) -> Appointment:
+    """
+    Check for an overlap and write in one transaction that holds the doctor's row lock
+    (SELECT ... FOR UPDATE), so concurrent bookings of one doctor run one at a time
+    across processes. SQLite ignores FOR UPDATE; there the per-doctor lock in this
+    process is what serializes them, so run a single worker on SQLite. Lock timeouts
+    and deadlocks are retried with backoff; a real overlap is never retried.
+    This blocks while it waits, so async callers run it with run_in_threadpool.
+    """
+    metrics.incr("booking_attempts_total")
+    waited = time.perf_counter()
+    lock = _doctor_lock(doctor_id)
+    if not lock.acquire(timeout=BOOKING_LOCK_TIMEOUT_SECONDS):
+        metrics.incr("booking_busy_total")
+        raise BookingBusy()
+    record("booking_lock", time.perf_counter() - waited)
+    try:
+        for attempt in range(BOOKING_MAX_RETRIES + 1):
+            try:
+                if db.query(Doctor.id).filter(Doctor.id == doctor_id).with_for_update().first() is None:
+                    raise DoctorNotFound(doctor_id)
+                # A locking read sees rows committed after this transaction's snapshot was taken
+                query = db.query(Appointment.id).filter(*overlap_criteria(doctor_id, start, end))
+                if exclude_id is not None:
+                    query = query.filter(Appointment.id != exclude_id)
+                conflict = query.with_for_update().first()
+                if conflict is not None:
+                    metrics.incr("booking_conflicts_total")
+                    raise SlotUnavailable(conflict.id)
+                appointment = apply()
+                db.commit()
+                db.refresh(appointment)
+                return appointment
+            except OperationalError as e:
+                db.rollback()
+                if attempt == BOOKING_MAX_RETRIES:
+                    logger.error(f"Booking for doctor {doctor_id} failed after {attempt + 1} attempts: {str(e)}")
+                    metrics.incr("booking_busy_total")
+                    raise BookingBusy() from e
+                metrics.incr("booking_retries_total")
+                time.sleep(_backoff(attempt))
+            except Exception:
+                # Booking errors, integrity errors and the like end the transaction too
+                db.rollback()
+                raise
+    finally:
+        lock.release()
+
+
+def book_appointment(db: Session, user_id: int, doctor_id: int, start_time: datetime, end_time: datetime,
+                     reason: str, status: AppointmentStatus = AppointmentStatus.PENDING) -> Appointment:
+    """Create an appointment unless it overlaps one of the doctor's; raises a BookingError otherwise"""
+    if end_time <= start_time:
+        raise ValueError("end_time must be after start_time")
+
+    def apply() -> Appointment:
+        appointment = Appointment(user_id=user_id, doctor_id=doctor_id, start_time=start_time, end_time=end_time,
+                                  reason=reason, status=status)
+        db.add(appointment)
+        return appointment
+
+    appointment = _write(db, doctor_id, start_time, end_time, None, apply)
+    logger.info(f"Created appointment: {appointment.id}")
+    return appointment
+
+
+def reschedule_appointment(db: Session, appointment: Appointment, start_time: datetime,
+                           end_time: datetime) -> Appointment:
+    """Move an appointment unless the new time overlaps another of the doctor's"""
+    if end_time <= start_time:
+        raise ValueError("end_time must be after start_time")
+    appointment_id, doctor_id = appointment.id, appointment.doctor_id
+
+    def apply() -> Appointment:
+        # A retry's rollback expired the instance; setting the times again is all it takes
+        appointment.start_time = start_time
+        appointment.end_time = end_time
+        return appointment
+
+    return _write(db, doctor_id, start_time, end_time, appointment_id, apply)
+
+
+def set_status(db: Session, appointment: Appointment, status: AppointmentStatus) -> Appointment:
+    """
+    Change an appointment's status. A cancelled appointment no longer holds its slot,
+    so bringing it back is checked for overlap like a new booking.
+    """
+    if appointment.status != AppointmentStatus.CANCELLED or status == AppointmentStatus.CANCELLED:
+        appointment.status = status
+        db.commit()
+        db.refresh(appointment)
+        return appointment
+    appointment_id, doctor_id = appointment.id, appointment.doctor_id
+    start_time, end_time = appointment.start_time, appointment.end_time
+
+    def apply() -> Appointment:
+        appointment.status = status
+        return appointment
+
+    return _write(db, doctor_id, start_time, end_time, appointment_id, apply)
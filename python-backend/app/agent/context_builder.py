@@ -0,0 +1,66 @@
+import os
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional
+
+from sqlalchemy import case
+from sqlalchemy.orm import Session, joinedload
+
+from ..models.appointment import Appointment
+from ..models.doctor import Doctor
+
+# The prompt prefix, user message and a 256-token reply must all fit in the default n_ctx of 2048
+CONTEXT_TOKEN_BUDGET = int(os.getenv("LLM_CONTEXT_TOKEN_BUDGET", "256"))
+RECENT_DAYS = int(os.getenv("LLM_CONTEXT_RECENT_DAYS", "30"))
+MAX_ROWS = int(os.getenv("LLM_CONTEXT_MAX_ROWS", "20"))
+
+
+def estimate_tokens(text: str) -> int:
+    """Conservative token estimate; Mistral splits digits individually, so dates are token-dense"""
+    return len(text) // 3 + 1
+
+
+def _render(apt: Appointment) -> str:
+    doctor = apt.doctor
+    doctor_name = f"Dr. {doctor.user.last_name}" if doctor is not None and doctor.user is not None else "(Unknown Doctor)"
+    return f"- {apt.start_time.strftime('%Y-%m-%d %H:%M')} with {doctor_name}: {apt.status.value}\n"
+
+
+def load_context_appointments(db: Session, user_id: int, now: datetime, recent_days: int = RECENT_DAYS,
+                              max_rows: int = MAX_ROWS) -> List[Appointment]:
+    """
+    Upcoming appointments (soonest first) followed by recent past ones (latest first),
+    with their doctor and doctor user eager-loaded in a single joined query
+    """
+    is_upcoming = Appointment.start_time >= now
+    return db.query(Appointment).options(
+        joinedload(Appointment.doctor).joinedload(Doctor.user)
+    ).filter(
+        Appointment.user_id == user_id,
+        Appointment.start_time >= now - timedelta(days=recent_days)
+    ).order_by(
+        case((is_upcoming, 0), else_=1),
+        case((is_upcoming, Appointment.start_time), else_=None).asc(),
+        Appointment.start_time.desc()
+    ).limit(max_rows).all()
+
+
+def build_appointment_context(db: Session, user_id: int, now: Optional[datetime] = None,
+                              token_budget: int = CONTEXT_TOKEN_BUDGET,
+                              count_tokens: Callable[[str], int] = estimate_tokens) -> str:
+    """Render the user's appointments compactly, stopping before the token budget is exceeded"""
+    now = now or datetime.now()
+    appointments = load_context_appointments(db, user_id, now)
+    if not appointments:
+        return ""
+    header = "\nYour existing appointments:\n"
+    context = header
+    used = count_tokens(header)
+    for i, apt in enumerate(appointments):
+        line = _render(apt)
+        cost = count_tokens(line)
+        if used + cost > token_budget:
+            context += f"- ... and {len(appointments) - i} more\n"
+            break
+        context += line
+        used += cost
+    return context
@@ -0,0 +1,210 @@
+import difflib
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy.orm import Session
+
+from ..metrics import metrics
+from ..models.doctor import Doctor
+from ..models.user import User, UserRole
+
+logger = logging.getLogger(__name__)
+
+# Shortest name the phonetic and fuzzy tiers look up; a fragment like "s" only matches exactly
+DOCTOR_NAME_MIN_LETTERS = int(os.getenv("DOCTOR_NAME_MIN_LETTERS", "3"))
+
+
+@dataclass
+class DoctorEntry:
+    user_id: int
+    first_name: str
+    last_name: str
+    doctor_id: Optional[int] = None
+
+
+def normalize(name: str) -> str:
+    return "".join(ch for ch in name.lower() if ch.isalpha())
+
+
+_SOUNDEX_CODES = {
+    **dict.fromkeys("bfpv", "1"), **dict.fromkeys("cgjkqsxz", "2"), **dict.fromkeys("dt", "3"),
+    "l": "4", **dict.fromkeys("mn", "5"), "r": "6",
+}
+
+
+def soundex(name: str) -> str:
+    """American Soundex; tolerant of the spelling variants Whisper produces for names"""
+    name = normalize(name)
+    if not name:
+        return ""
+    code = name[0].upper()
+    previous = _SOUNDEX_CODES.get(name[0], "")
+    for ch in name[1:]:
+        digit = _SOUNDEX_CODES.get(ch, "")
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        if ch not in "hw":
+            previous = digit
+    return code.ljust(4, "0")
+
+
+class DoctorIndex:
+    """
+    In-memory directory of doctor users for agent name resolution. Names are indexed
+    exactly (case-insensitive, like the ilike queries it replaces), by first initial,
+    and phonetically, with a fuzzy match as the last resort. Routers that write users
+    or doctors update it incrementally; a periodic reload keeps other workers in sync.
+    """
+
+    def __init__(self, ttl_seconds: float = 300):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.RLock()
+        self._entries: Dict[int, DoctorEntry] = {}
+        self._by_full: Dict[str, Set[int]] = defaultdict(set)
+        self._by_last: Dict[str, Set[int]] = defaultdict(set)
+        self._by_phonetic: Dict[str, Set[int]] = defaultdict(set)
+        self._loaded_at: Optional[float] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    def load(self, db: Session):
+        rows = db.query(User.id, User.first_name, User.last_name, Doctor.id).outerjoin(
+            Doctor, Doctor.user_id == User.id
+        ).filter(User.role == UserRole.DOCTOR).all()
+        with self._lock:
+            self._entries.clear()
+            self._by_full.clear()
+            self._by_last.clear()
+            self._by_phonetic.clear()
+            for user_id, first_name, last_name, doctor_id in rows:
+                self._add(DoctorEntry(user_id, first_name, last_name, doctor_id))
+            self._loaded_at = time.monotonic()
+        metrics.set_gauge("doctor_index_entries", len(self._entries))
+        logger.info(f"Doctor index loaded with {len(rows)} doctors")
+
+    def ensure_loaded(self, db: Session):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl_seconds:
+            self.load(db)
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    # --- incremental updates ---
+    def _add(self, entry: DoctorEntry):
+        first, last = normalize(entry.first_name), normalize(entry.last_name)
+        self._entries[entry.user_id] = entry
+        self._by_full[f"{first} {last}"].add(entry.user_id)
+        self._by_last[last].add(entry.user_id)
+        self._by_phonetic[f"{soundex(first)} {soundex(last)}"].add(entry.user_id)
+        self._by_phonetic[soundex(last)].add(entry.user_id)
+
+    def _discard(self, user_id: int) -> Optional[DoctorEntry]:
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return None
+        first, last = normalize(entry.first_name), normalize(entry.last_name)
+        for index, key in ((self._by_full, f"{first} {last}"), (self._by_last, last),
+                           (self._by_phonetic, f"{soundex(first)} {soundex(last)}"),
+                           (self._by_phonetic, soundex(last))):
+            index[key].discard(user_id)
+            if not index[key]:
+                del index[key]
+        return entry
+
+    def on_user_saved(self, user: User):
+        if not self.loaded:
+            return
+        with self._lock:
+            previous = self._discard(user.id)
+            if user.role == UserRole.DOCTOR:
+                doctor_id = previous.doctor_id if previous else None
+                self._add(DoctorEntry(user.id, user.first_name, user.last_name, doctor_id))
+        metrics.set_gauge("doctor_index_entries", len(self._entries))
+
+    def on_user_deleted(self, user_id: int):
+        with self._lock:
+            self._discard(user_id)
+        metrics.set_gauge("doctor_index_entries", len(self._entries))
+
+    def on_doctor_saved(self, doctor: Doctor):
+        with self._lock:
+            entry = self._entries.get(doctor.user_id)
+            if entry is not None:
+                entry.doctor_id = doctor.id
+            elif self.loaded:
+                # Profile for a user we have not seen yet; pick it up on next lookup
+                self._loaded_at = None
+
+    def on_doctor_deleted(self, doctor_id: int):
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.doctor_id == doctor_id:
+                    entry.doctor_id = None
+
+    # --- lookup ---
+    def _pick(self, user_ids: Iterable[int]) -> Optional[DoctorEntry]:
+        # Deterministic choice when several doctors share a name
+        user_ids = sorted(user_ids)
+        return self._entries[user_ids[0]] if user_ids else None
+
+    def _fuzzy(self, query: str, candidates: Dict[str, Set[int]]) -> Optional[DoctorEntry]:
+        matches = difflib.get_close_matches(query, list(candidates), n=1, cutoff=0.8)
+        return self._pick(candidates[matches[0]]) if matches else None
+
+    def resolve(self, first: str, last: Optional[str] = None) -> Optional[DoctorEntry]:
+        """
+        Resolve "Dr. First Last" or "Dr. Last" to a doctor user. Exact matches win, then
+        first-initial matches ("Dr. J Smith"), then phonetic, then fuzzy spelling matches,
+        and finally the first word alone as a surname. Names shorter than
+        DOCTOR_NAME_MIN_LETTERS skip the phonetic and fuzzy tiers, so a stray letter
+        resolves to nobody and the caller asks which doctor is meant.
+        """
+        first, last = normalize(first), normalize(last) if last else None
+        first_ok = len(first) >= DOCTOR_NAME_MIN_LETTERS
+        with self._lock:
+            if last:
+                last_ok = len(last) >= DOCTOR_NAME_MIN_LETTERS
+                tiers = (
+                    ("exact", lambda: self._pick(self._by_full.get(f"{first} {last}", ()))),
+                    ("initial", lambda: self._pick(
+                        uid for uid in self._by_last.get(last, ())
+                        if normalize(self._entries[uid].first_name).startswith(first[:1])
+                    ) if len(first) == 1 else None),
+                    ("phonetic", lambda: self._pick(self._by_phonetic.get(f"{soundex(first)} {soundex(last)}", ()))
+                     if first_ok and last_ok else None),
+                    ("fuzzy", lambda: self._fuzzy(f"{first} {last}", self._by_full) if first_ok and last_ok else None),
+                    # The agent patterns capture the word after a surname too ("Dr. Smith to ...")
+                    ("surname", lambda: self._pick(self._by_last.get(first, ()))),
+                    ("surname_phonetic", lambda: self._pick(self._by_phonetic.get(soundex(first), ()))
+                     if first_ok else None),
+                )
+            else:
+                tiers = (
+                    ("exact", lambda: self._pick(self._by_last.get(first, ()))),
+                    ("phonetic", lambda: self._pick(self._by_phonetic.get(soundex(first), ())) if first_ok else None),
+                    ("fuzzy", lambda: self._fuzzy(first, self._by_last) if first_ok else None),
+                )
+            for tier, match in tiers:
+                entry = match()
+                if entry is not None:
+                    metrics.incr(f"doctor_index_{tier}_matches_total")
+                    return entry
+        metrics.incr("doctor_index_misses_total")
+        return None
+
+    def entries(self) -> List[DoctorEntry]:
+        with self._lock:
+            return list(self._entries.values())
+
+
+doctor_index = DoctorIndex(ttl_seconds=float(os.getenv("DOCTOR_INDEX_TTL_SECONDS", "300")))
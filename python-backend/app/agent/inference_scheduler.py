@@ -0,0 +1,295 @@
+import asyncio
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+from typing import AsyncIterator, Callable, Optional
+
+from ..metrics import metrics
+from .model_registry import default_concurrency
+
+logger = logging.getLogger(__name__)
+
+# Lower value runs first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+PRIORITY_LOW = 20
+
+
+class SchedulerFullError(Exception):
+    """Raised when the inference queue is full and the request is not admitted"""
+
+    def __init__(self, queue_depth: int):
+        self.queue_depth = queue_depth
+        super().__init__(f"The assistant is busy ({queue_depth} requests waiting). Please try again shortly.")
+
+
+class GenerationCancelled(Exception):
+    """Raised when a generation is stopped because its client left or its deadline passed"""
+
+    def __init__(self, reason: str):
+        self.reason = reason
+        super().__init__("The request timed out." if reason == CancelToken.TIMEOUT else "The request was cancelled.")
+
+
+class CancelToken:
+    """
+    Shared between a request and the worker running its generation. The request side
+    cancels it on client disconnect; the deadline expires it on its own. Generation
+    loops poll it between tokens, so the worker is freed within one token.
+    """
+    TIMEOUT = "timeout"
+    DISCONNECTED = "disconnected"
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self._reason: Optional[str] = None
+        self._recorded = False
+        self._lock = threading.Lock()
+
+    def cancel(self, reason: str = DISCONNECTED):
+        with self._lock:
+            if self._reason is None:
+                self._reason = reason
+
+    @property
+    def reason(self) -> Optional[str]:
+        if self._reason is None and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(self.TIMEOUT)
+        return self._reason
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def remaining(self) -> Optional[float]:
+        return max(0.0, self.deadline - time.monotonic()) if self.deadline is not None else None
+
+    def check(self):
+        """Raise GenerationCancelled if the request is over, recording it once"""
+        reason = self.reason
+        if reason is None:
+            return
+        with self._lock:
+            first = not self._recorded
+            self._recorded = True
+        if first:
+            metrics.incr("llm_generations_timed_out_total" if reason == self.TIMEOUT else "llm_generations_cancelled_total")
+            logger.info(f"Stopped LLM generation: {reason}")
+        raise GenerationCancelled(reason)
+
+
+class _Job:
+    """A call whose single return value resolves an asyncio future"""
+
+    def __init__(self, fn, args, kwargs, loop, cancel: Optional[CancelToken] = None):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.loop = loop
+        self.cancel = cancel
+        self.future = loop.create_future()
+        self.enqueued_at = time.perf_counter()
+
+    def cancelled(self) -> bool:
+        return self.future.cancelled() or (self.cancel is not None and self.cancel.cancelled)
+
+    def abort(self, error: Exception):
+        self.loop.call_soon_threadsafe(_resolve, self.future, None, error)
+
+    def run(self):
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+            self.loop.call_soon_threadsafe(_resolve, self.future, result)
+        except GenerationCancelled as e:
+            self.abort(e)
+        except Exception as e:
+            logger.error(f"Inference job failed: {str(e)}")
+            self.loop.call_soon_threadsafe(_resolve, self.future, None, e)
+
+
+class _StreamJob(_Job):
+    """A generator call whose items are forwarded to the event loop as they are produced"""
+
+    def __init__(self, fn, args, kwargs, loop, cancel: Optional[CancelToken] = None):
+        super().__init__(fn, args, kwargs, loop, cancel)
+        self.items = asyncio.Queue()
+
+    def run(self):
+        try:
+            for item in self.fn(*self.args, **self.kwargs):
+                self.loop.call_soon_threadsafe(self.items.put_nowait, (item, None))
+            self.loop.call_soon_threadsafe(self.items.put_nowait, (_END, None))
+        except GenerationCancelled as e:
+            self.abort(e)
+        except Exception as e:
+            logger.error(f"Streaming inference job failed: {str(e)}")
+            self.loop.call_soon_threadsafe(self.items.put_nowait, (_END, e))
+
+    async def iterate(self):
+        while True:
+            remaining = self.cancel.remaining() if self.cancel is not None else None
+            try:
+                item, error = await asyncio.wait_for(self.items.get(), remaining)
+            except asyncio.TimeoutError:
+                self.cancel.cancel(CancelToken.TIMEOUT)
+                self.cancel.check()
+            if error is not None:
+                raise error
+            if item is _END:
+                return
+            yield item
+
+    def abort(self, error: Exception):
+        self.loop.call_soon_threadsafe(self.items.put_nowait, (_END, error))
+
+
+_END = object()
+
+
+def _resolve(future, result=None, error=None):
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class InferenceScheduler:
+    """Runs blocking LLM calls on dedicated worker threads behind a bounded priority queue"""
+
+    def __init__(self, workers: int = 1, max_queue: int = 8):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._running = 0
+        self._threads = []
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"llm-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            logger.info(f"Started {self.workers} LLM worker(s) with queue size {self.max_queue}")
+
+    @property
+    def queue_depth(self) -> int:
+        return self._waiting
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    def _update_gauges(self):
+        metrics.set_gauge("llm_queue_depth", self._waiting)
+        metrics.set_gauge("llm_running", self._running)
+
+    def _enqueue(self, job: _Job, priority: int):
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                metrics.incr("llm_requests_rejected_total")
+                raise SchedulerFullError(self._waiting)
+            self._waiting += 1
+            self._update_gauges()
+        metrics.incr("llm_requests_admitted_total")
+        self._queue.put((priority, next(self._seq), job))
+
+    async def submit(self, fn: Callable, *args, priority: int = PRIORITY_NORMAL,
+                     cancel: Optional[CancelToken] = None, **kwargs):
+        """
+        Run fn(*args, **kwargs) on an inference worker and await its result. With a
+        cancel token, a job still queued when the request ends is skipped, and the wait
+        is bounded by the token's deadline.
+        """
+        self._ensure_started()
+        job = _Job(fn, args, kwargs, asyncio.get_running_loop(), cancel)
+        self._enqueue(job, priority)
+        try:
+            if cancel is None:
+                return await job.future
+            return await asyncio.wait_for(job.future, cancel.remaining())
+        except asyncio.TimeoutError:
+            cancel.cancel(CancelToken.TIMEOUT)
+            cancel.check()
+        except asyncio.CancelledError:
+            # The awaiting request went away; stop the generation if it already started
+            if cancel is not None:
+                cancel.cancel(CancelToken.DISCONNECTED)
+            raise
+
+    def stream(self, fn: Callable, *args, priority: int = PRIORITY_NORMAL,
+               cancel: Optional[CancelToken] = None, **kwargs) -> AsyncIterator:
+        """
+        Run the generator function fn on an inference worker and return an async iterator
+        over its items. Admission is decided immediately, so SchedulerFullError is raised
+        here rather than on first iteration.
+        """
+        self._ensure_started()
+        job = _StreamJob(fn, args, kwargs, asyncio.get_running_loop(), cancel)
+        self._enqueue(job, priority)
+        return job.iterate()
+
+    def _worker(self):
+        while True:
+            _, _, job = self._queue.get()
+            if job is None:
+                break
+            with self._lock:
+                self._waiting -= 1
+                self._running += 1
+                self._update_gauges()
+            metrics.incr("llm_queue_wait_seconds_total", time.perf_counter() - job.enqueued_at)
+            try:
+                if job.cancel is not None and job.cancel.cancelled:
+                    # Never started, so no worker time is spent on a request nobody awaits
+                    try:
+                        job.cancel.check()
+                    except GenerationCancelled as e:
+                        job.abort(e)
+                elif not job.cancelled():
+                    job.run()
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._update_gauges()
+
+    def shutdown(self):
+        for _ in self._threads:
+            # Sentinels sort after every real job
+            self._queue.put((float("inf"), next(self._seq), None))
+        self._threads = []
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> InferenceScheduler:
+    """Return the process-wide inference scheduler"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = InferenceScheduler(
+                    workers=int(os.getenv("LLM_WORKERS", str(default_concurrency()))),
+                    max_queue=int(os.getenv("LLM_QUEUE_SIZE", "8")),
+                )
+    return _scheduler
+
+
+def set_scheduler(scheduler: InferenceScheduler):
+    """Replace the process-wide scheduler (used by benchmarks to size the worker pool)"""
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = scheduler
@@ -0,0 +1,196 @@
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, FrozenSet, Optional, Set, Tuple
+
+
+@dataclass
+class Intent:
+    """A classified agent message: the intent name plus the slots extracted for it"""
+    name: str
+    slots: Dict[str, Any] = field(default_factory=dict)
+
+
+FALLBACK = "fallback"
+
+# One scan over the lowercased message finds every anchor keyword. No keyword's suffix is
+# another keyword's prefix, so finditer cannot hide one occurrence behind another.
+_ANCHORS = re.compile(
+    r"(?P<user>user)|(?P<doctor>doctor)|(?P<appointment>appointment)|(?P<dr>dr)"
+    r"|(?P<book>book)|(?P<schedul>schedul)|(?P<digit>\d+)"
+)
+
+
+class _Rule:
+    """
+    An intent is tried only when all of its anchor keywords occur in the message. The
+    anchors are necessary conditions of the rule's patterns, so skipping a rule never
+    changes which intent wins; it only avoids running patterns that cannot match.
+    """
+
+    def __init__(self, name: str, requires: Tuple[str, ...], pattern: Optional[str] = None,
+                 fields: Tuple[str, ...] = (), trigger: Optional[str] = None, flags: int = 0,
+                 any_of: Tuple[str, ...] = (), extractor: Optional[Callable[[str, str], Optional[Dict]]] = None,
+                 post: Optional[Callable[[Dict, str], Dict]] = None):
+        self.name = name
+        self.requires: FrozenSet[str] = frozenset(requires)
+        self.any_of: FrozenSet[str] = frozenset(any_of)
+        self.trigger = re.compile(trigger, flags) if trigger else None
+        self.pattern = re.compile(pattern, flags) if pattern else None
+        self.fields = fields
+        self.extractor = extractor
+        self.post = post
+
+    def applies(self, anchors: Set[str]) -> bool:
+        return self.requires <= anchors and (not self.any_of or not self.any_of.isdisjoint(anchors))
+
+    def extract(self, msg: str, message: str) -> Optional[Dict]:
+        if self.extractor:
+            return self.extractor(msg, message)
+        if self.trigger and not self.trigger.search(msg):
+            return None
+        m = self.pattern.search(msg)
+        if not m:
+            return None
+        slots = dict(zip(self.fields, m.groups()))
+        return self.post(slots, msg) if self.post else slots
+
+
+_BOOKING = re.compile(r"book|schedule|make an appointment", re.IGNORECASE)
+_DOCTOR_NAME = re.compile(r"Dr\.?\s*([A-Za-z]+)(?:\s+([A-Za-z]+))?")
+_DATE_ON = re.compile(r"on ([^,]+)", re.IGNORECASE)
+_DATE_LITERAL = re.compile(r"today|tomorrow|\d{4}-\d{2}-\d{2}|\d{1,2}/\d{1,2}/\d{2,4}|\d{1,2}(?:st|nd|rd|th)? [A-Za-z]+ \d{4}", re.IGNORECASE)
+_TIME = re.compile(r"(\d{1,2})(?::(\d{2}))?\s*(a\.m\.|am|p\.m\.|pm)?", re.IGNORECASE)
+_REASON = re.compile(
+    r"for (.+?)(?= with dr| with doctor| tomorrow| today| at | on | by | for | in | from | am| pm| a\.m\.| p\.m\.|$)",
+    re.IGNORECASE
+)
+
+
+def _extract_booking(msg: str, message: str) -> Optional[Dict]:
+    """Booking slots are read from the original message, as the doctor name is case-sensitive"""
+    booking_match = _BOOKING.search(message)
+    if not booking_match:
+        return None
+    doctor_match = _DOCTOR_NAME.search(message)
+    if not doctor_match:
+        return None
+    date_match = _DATE_ON.search(message) or _DATE_LITERAL.search(message)
+    if not date_match:
+        return None
+    time_match = _TIME.search(message)
+    if not time_match:
+        return None
+    reason_match = _REASON.search(message)
+    return {
+        "doctor_first": doctor_match.group(1),
+        "doctor_last": doctor_match.group(2),
+        "date_token": date_match.group(0),
+        "date_text": date_match.group(1) if date_match.lastindex else date_match.group(0),
+        "hour": time_match.group(1),
+        "minute": time_match.group(2),
+        "ampm": time_match.group(3),
+        "reason": reason_match.group(1).strip() if reason_match else "Scheduled via agent",
+        "message": message,
+    }
+
+
+_AVAILABILITY = re.compile(
+    r"\bavailab|\bopen (?:slot|time)s?\b|\bopenings?\b|\bfree (?:slots?|times?|on|today|tomorrow|next|this)\b"
+    r"|\b(?:is|are) (?:dr\.?|doctor) ?[a-z]+(?: [a-z]+)? free\b|\bwhen can i see\b"
+)
+# "dr"/"doctor" as a whole word, so "doctors" does not yield the name "s"
+_ANY_DOCTOR_NAME = re.compile(r"\b(?:dr\b\.?|doctor\b)\s+([A-Za-z]+)(?:\s+([A-Za-z]+))?", re.IGNORECASE)
+# Words that follow "doctor"/"Dr. Smith" in availability questions but are not names
+_NOT_NAMES = {"available", "availability", "free", "open", "openings", "slots", "times", "is", "has", "have",
+              "on", "for", "at", "in", "after", "before", "today", "tomorrow", "next", "this"}
+
+
+def _extract_availability(msg: str, message: str) -> Optional[Dict]:
+    """A named doctor plus an availability phrase; the date, if any, is parsed by the handler"""
+    if not _AVAILABILITY.search(msg):
+        return None
+    doctor_match = _ANY_DOCTOR_NAME.search(message)
+    if not doctor_match or doctor_match.group(1).lower() in _NOT_NAMES:
+        return None
+    first, last = doctor_match.groups()
+    if last is not None and last.lower() in _NOT_NAMES:
+        last = None
+    # A lone letter is an initial, not a name to look up
+    if len(first) < 2 and last is None:
+        return None
+    return {
+        "doctor_first": first,
+        "doctor_last": last,
+        "when": message,
+    }
+
+
+def _mentions_tomorrow(slots: Dict, msg: str) -> Dict:
+    slots["mentions_tomorrow"] = "tomorrow" in msg
+    return slots
+
+
+_RESCHEDULE_VERB = r"reschedul(?:e|ing|ed|ule|uled|uling|ul|ule)?"
+
+# Ordered by priority: the first rule whose slots can be extracted wins
+RULES = (
+    # --- USER CRUD ---
+    _Rule("create_user", ("user",), trigger=r"create user|add user|register user",
+          pattern=r"user ([a-zA-Z]+) ([a-zA-Z]+) with email ([^ ]+) and role ([A-Z]+)",
+          fields=("first_name", "last_name", "email", "role")),
+    _Rule("delete_user", ("user", "digit"), pattern=r"delete user (\d+)", fields=("user_id",)),
+    _Rule("list_users", ("user",), pattern=r"list users|show users|all users"),
+    # --- DOCTOR CRUD ---
+    _Rule("create_doctor", ("doctor", "digit"), trigger=r"create doctor|add doctor",
+          pattern=r"doctor ([a-zA-Z]+) ([a-zA-Z]+) with specialization ([^,]+), license ([^ ]+), user (\d+)",
+          fields=("first_name", "last_name", "specialization", "license_number", "user_id")),
+    _Rule("delete_doctor", ("doctor", "digit"), pattern=r"delete doctor (\d+)", fields=("doctor_id",)),
+    _Rule("list_doctors", ("doctor",), pattern=r"list doctors|show doctors|all doctors"),
+    # --- APPOINTMENT CRUD ---
+    _Rule("delete_appointment", ("appointment", "digit"), pattern=r"delete appointment (\d+)", fields=("appointment_id",)),
+    _Rule("list_all_appointments", ("appointment",), pattern=r"list appointments|show appointments|all appointments"),
+    _Rule("reschedule_appointment", ("appointment", "schedul", "digit"),
+          pattern=r"reschedule appointment (\d+) to (\d{4}-\d{2}-\d{2}) (\d{1,2}):(\d{2})",
+          fields=("appointment_id", "date", "hour", "minute")),
+    # --- NATURAL LANGUAGE ---
+    _Rule("change_appointment", ("appointment", "digit"),
+          pattern=r"(?:change|" + _RESCHEDULE_VERB + r") appointment (\d+) to ([^\n]+)",
+          fields=("appointment_id", "when"), flags=re.IGNORECASE),
+    _Rule("list_appointments", ("appointment",),
+          pattern=r"(show|list|display|what are|which are|my|all)? ?(upcoming|current|future|pending|confirmed|cancelled|completed)? ?appointments",
+          fields=("verb", "status")),
+    _Rule("cancel_appointment", ("appointment", "dr"),
+          pattern=r"(delete|cancel) my appointment with dr\.?\s*([A-Za-z]+)(?:\s+([A-Za-z]+))?(?: of| for| on| at)? ([^\n]*)",
+          fields=("action", "doctor_first", "doctor_last", "when"), flags=re.IGNORECASE, post=_mentions_tomorrow),
+    _Rule("reschedule_my_appointment", ("appointment", "schedul"),
+          pattern=_RESCHEDULE_VERB + r" (?:my )?appointment(?: with dr\.?\s*([A-Za-z]+)(?:\s+([A-Za-z]+))?)?(?: for| to| on| at)? ([^\n]+)",
+          fields=("doctor_first", "doctor_last", "when"), flags=re.IGNORECASE),
+    _Rule("book_appointment", ("dr", "digit"), any_of=("book", "schedul", "appointment"), extractor=_extract_booking),
+    # After booking, so "book ... if Dr. Smith is available" still books
+    _Rule("doctor_availability", (), any_of=("dr", "doctor"), extractor=_extract_availability),
+)
+
+
+class IntentRouter:
+    """Classifies an agent message in one anchor scan followed by targeted slot extraction"""
+
+    def __init__(self, rules=RULES):
+        self.rules = rules
+
+    @staticmethod
+    def anchors(msg: str) -> Set[str]:
+        return {m.lastgroup for m in _ANCHORS.finditer(msg)}
+
+    def classify(self, message: str) -> Intent:
+        msg = message.lower()
+        anchors = self.anchors(msg)
+        for rule in self.rules:
+            if not rule.applies(anchors):
+                continue
+            slots = rule.extract(msg, message)
+            if slots is not None:
+                return Intent(rule.name, slots)
+        return Intent(FALLBACK)
+
+
+intent_router = IntentRouter()
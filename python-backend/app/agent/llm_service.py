@@ -0,0 +1,260 @@
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List
+
+from ..metrics import metrics
+from .prefix_cache import PrefixCache
+
+logger = logging.getLogger(__name__)
+
+_DONE = "done"
+_ERROR = "error"
+
+
+def _compile_grammar(source: str, grammars: Dict[str, object]):
+    if source not in grammars:
+        try:
+            from llama_cpp import LlamaGrammar
+        except ImportError:
+            # Stand-in models used in benchmarks take the grammar as-is
+            return source
+        grammars[source] = LlamaGrammar.from_string(source, verbose=False)
+    return grammars[source]
+
+
+def _replica_main(conn, index: int, factory: Callable):
+    """
+    Entry point of a replica process: load one model, then serve requests one at a
+    time. While streaming, the pipe is polled between tokens so a cancel for the
+    current request stops it; other messages that arrive meanwhile are queued.
+    """
+    logging.basicConfig(level=logging.INFO)
+    started = time.perf_counter()
+    try:
+        llm = factory()
+    except Exception as e:
+        conn.send(("failed", index, str(e)))
+        return
+    conn.send(("ready", index, time.perf_counter() - started))
+    prefix_caches: Dict[str, PrefixCache] = {}
+    grammars: Dict[str, object] = {}
+    pending = deque()
+    while True:
+        try:
+            message = pending.popleft() if pending else conn.recv()
+        except EOFError:
+            return
+        if message[0] == "stop":
+            return
+        if message[0] == "cancel":
+            # The request already finished
+            continue
+        _, request_id, prompt, kwargs, prefix = message
+        try:
+            if prefix:
+                prefix_caches.setdefault(prefix, PrefixCache(prefix)).prepare(llm)
+            if isinstance(kwargs.get("grammar"), str):
+                # Compiled grammars cannot be pickled, so the API process sends their source
+                kwargs["grammar"] = _compile_grammar(kwargs["grammar"], grammars)
+            if not kwargs.get("stream"):
+                conn.send(("result", request_id, llm(prompt, **kwargs)))
+                continue
+            chunks = llm(prompt, **kwargs)
+            try:
+                for chunk in chunks:
+                    conn.send(("chunk", request_id, chunk))
+                    cancelled = False
+                    while conn.poll():
+                        incoming = conn.recv()
+                        if incoming[0] == "cancel" and incoming[1] == request_id:
+                            cancelled = True
+                        else:
+                            pending.append(incoming)
+                    if cancelled:
+                        break
+            finally:
+                close = getattr(chunks, "close", None)
+                if close:
+                    close()
+            conn.send((_DONE, request_id, None))
+        except Exception as e:
+            conn.send((_ERROR, request_id, str(e)))
+
+
+class _Replica:
+    def __init__(self, index: int, process, conn):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.send_lock = threading.Lock()
+        self.requests: Dict[int, queue.Queue] = {}
+        self.in_flight = 0
+        self.served = 0
+        self.alive = False
+        self.ready = threading.Event()
+
+    def send(self, message):
+        with self.send_lock:
+            self.conn.send(message)
+
+
+class ReplicaPool:
+    """
+    llama_cpp.Llama look-alike that dispatches each call to the least-loaded of N
+    model replicas running in their own processes. Each replica owns one model and
+    one llama.cpp context, so calls need no process-wide model lock; the GGUF file
+    is memory-mapped, so replicas share its pages through the OS page cache.
+    """
+    remote = True
+
+    def __init__(self, replicas: int, factory: Callable, start_timeout: float = 600):
+        self.replicas = replicas
+        self.factory = factory
+        self.start_timeout = start_timeout
+        self._context = multiprocessing.get_context("spawn")
+        self._replicas: List[_Replica] = []
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._prefix = threading.local()
+
+    def start(self):
+        started = time.perf_counter()
+        for index in range(self.replicas):
+            self._replicas.append(self._spawn(index))
+        deadline = time.monotonic() + self.start_timeout
+        for replica in self._replicas:
+            if not replica.ready.wait(max(0.0, deadline - time.monotonic())) or not replica.alive:
+                self.shutdown()
+                raise RuntimeError(f"LLM replica {replica.index} failed to start")
+        logger.info(f"Started {self.replicas} LLM replica process(es) in {time.perf_counter() - started:.2f}s")
+        return self
+
+    def _spawn(self, index: int) -> _Replica:
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=_replica_main, args=(child_conn, index, self.factory),
+                                        name=f"llm-replica-{index}", daemon=True)
+        process.start()
+        child_conn.close()
+        replica = _Replica(index, process, parent_conn)
+        threading.Thread(target=self._read, args=(replica,), name=f"llm-replica-reader-{index}", daemon=True).start()
+        return replica
+
+    def _read(self, replica: _Replica):
+        """Route a replica's replies to the threads waiting on them"""
+        while True:
+            try:
+                kind, key, payload = replica.conn.recv()
+            except (EOFError, OSError):
+                break
+            if kind == "ready":
+                replica.alive = True
+                replica.ready.set()
+                logger.info(f"LLM replica {replica.index} loaded its model in {payload:.2f}s")
+                continue
+            if kind == "failed":
+                logger.error(f"LLM replica {replica.index} could not load its model: {payload}")
+                replica.ready.set()
+                break
+            waiting = replica.requests.get(key)
+            if waiting is not None:
+                waiting.put((kind, payload))
+        replica.alive = False
+        replica.ready.set()
+        self._update_gauges()
+        with self._lock:
+            orphaned = list(replica.requests.values())
+        for waiting in orphaned:
+            waiting.put((_ERROR, f"LLM replica {replica.index} exited"))
+
+    def _update_gauges(self):
+        metrics.set_gauge("llm_replicas_alive", sum(1 for r in self._replicas if r.alive))
+        for replica in self._replicas:
+            metrics.set_gauge(f"llm_replica_{replica.index}_in_flight", replica.in_flight)
+
+    def _acquire(self) -> _Replica:
+        with self._lock:
+            alive = [r for r in self._replicas if r.alive]
+            if not alive:
+                raise RuntimeError("No LLM replicas are running")
+            # Least in-flight work first; fewest served breaks ties so load spreads evenly
+            replica = min(alive, key=lambda r: (r.in_flight, r.served))
+            replica.in_flight += 1
+            replica.served += 1
+        metrics.incr("llm_replica_dispatch_total")
+        self._update_gauges()
+        return replica
+
+    def _release(self, replica: _Replica, request_id: int):
+        with self._lock:
+            replica.in_flight -= 1
+            replica.requests.pop(request_id, None)
+        self._update_gauges()
+
+    def use_prefix(self, prefix: str):
+        """Name the static prompt prefix for this thread's next call; the replica restores its KV state"""
+        self._prefix.value = prefix
+
+    def __call__(self, prompt: str, **kwargs):
+        prefix = getattr(self._prefix, "value", None)
+        self._prefix.value = None
+        replica = self._acquire()
+        request_id = next(self._ids)
+        replies = queue.Queue()
+        replica.requests[request_id] = replies
+        try:
+            replica.send(("generate", request_id, prompt, kwargs, prefix))
+        except Exception:
+            self._release(replica, request_id)
+            raise
+        if kwargs.get("stream"):
+            return self._stream(replica, request_id, replies)
+        try:
+            kind, payload = replies.get()
+            if kind == _ERROR:
+                raise RuntimeError(payload)
+            return payload
+        finally:
+            self._release(replica, request_id)
+
+    def _stream(self, replica: _Replica, request_id: int, replies: queue.Queue):
+        finished = False
+        try:
+            while True:
+                kind, payload = replies.get()
+                if kind == _DONE:
+                    finished = True
+                    return
+                if kind == _ERROR:
+                    finished = True
+                    raise RuntimeError(payload)
+                yield payload
+        finally:
+            if not finished and replica.alive:
+                # The consumer stopped early; stop generating on the replica too
+                replica.send(("cancel", request_id, None))
+                while replies.get()[0] not in (_DONE, _ERROR):
+                    pass
+            self._release(replica, request_id)
+
+    def stats(self) -> List[Dict]:
+        with self._lock:
+            return [{"replica": r.index, "alive": r.alive, "in_flight": r.in_flight, "served": r.served}
+                    for r in self._replicas]
+
+    def shutdown(self):
+        for replica in self._replicas:
+            try:
+                replica.send(("stop", None, None))
+            except Exception:
+                pass
+        for replica in self._replicas:
+            replica.process.join(timeout=10)
+            if replica.process.is_alive():
+                replica.process.terminate()
+        self._replicas = []
+        logger.info("LLM replicas stopped")
@@ -0,0 +1,109 @@
+import os
+import logging
+import threading
+import time
+from contextlib import nullcontext
+from dotenv import load_dotenv
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+try:
+    from llama_cpp import Llama
+except ImportError:
+    Llama = None
+    logger.error("llama-cpp-python is not installed. Please install it with 'pip install llama-cpp-python'.")
+
+from .runtime_profile import RuntimeProfile, load_profile, validate, record
+
+# "inprocess" loads the model in the API process; "service" runs LLM_REPLICAS worker
+# processes with a model each and dispatches every call to the least-loaded one
+LLM_MODE = os.getenv("LLM_MODE", "inprocess").lower()
+LLM_REPLICAS = int(os.getenv("LLM_REPLICAS", "2"))
+
+# Process-wide model instance (or replica pool) shared by every AppointmentAgent
+_llm = None
+_profile = None
+_lock = threading.Lock()
+# llama.cpp contexts are not thread-safe; hold this around every call into the model
+model_lock = threading.Lock()
+
+
+def get_profile() -> RuntimeProfile:
+    """The validated runtime profile; invalid settings raise RuntimeProfileError"""
+    global _profile
+    if _profile is None:
+        replicas = LLM_REPLICAS if LLM_MODE == "service" else 1
+        profile = load_profile(replicas=replicas)
+        record(profile, validate(profile, replicas=replicas))
+        _profile = profile
+    return _profile
+
+
+def _load_llm():
+    profile = get_profile()
+    if not Llama:
+        raise ImportError("llama-cpp-python is not installed.")
+    if not os.path.exists(profile.model_path):
+        raise FileNotFoundError(f"Mistral 7B GGUF model not found at {profile.model_path}")
+    logger.info(f"Loading Mistral model from {profile.model_path}")
+    started = time.perf_counter()
+    llm = Llama(**profile.llama_kwargs())
+    logger.info(f"Mistral model loaded in {time.perf_counter() - started:.2f}s")
+    return llm
+
+
+def _start_replicas():
+    from .llm_service import ReplicaPool
+    return ReplicaPool(LLM_REPLICAS, factory=_load_llm).start()
+
+
+def get_llm():
+    """Return the shared Mistral model (or replica pool), loading it on first use"""
+    global _llm
+    if _llm is None:
+        with _lock:
+            if _llm is None:
+                _llm = _start_replicas() if LLM_MODE == "service" else _load_llm()
+    return _llm
+
+
+def model_guard(llm):
+    """Context manager to hold around a call into llm; replicas serialize their own calls"""
+    return nullcontext() if getattr(llm, "remote", False) else model_lock
+
+
+def default_concurrency() -> int:
+    """How many calls can usefully run at once: one per replica, or one in-process"""
+    return LLM_REPLICAS if LLM_MODE == "service" else 1
+
+
+def set_llm(llm):
+    """Replace the shared model (used by tests and benchmarks to inject a stand-in)"""
+    global _llm
+    with _lock:
+        _llm = llm
+
+
+def is_loaded() -> bool:
+    return _llm is not None
+
+
+def shutdown():
+    """Stop replica processes, if any"""
+    global _llm
+    with _lock:
+        if getattr(_llm, "remote", False):
+            _llm.shutdown()
+            _llm = None
+
+
+def preload():
+    """Validate the runtime profile, and load the model at startup when PRELOAD_MISTRAL_MODEL is enabled"""
+    get_profile()
+    if os.getenv("PRELOAD_MISTRAL_MODEL", "false").lower() not in ("1", "true", "yes"):
+        return
+    try:
+        get_llm()
+    except Exception as e:
+        # The regex-handled intents keep working without the model
+        logger.error(f"Could not preload Mistral model: {str(e)}")
@@ -0,0 +1,78 @@
+import logging
+import threading
+import time
+from typing import Dict
+
+from ..metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class _Snapshot:
+    __slots__ = ("llm", "tokens", "state")
+
+    def __init__(self, llm, tokens, state):
+        self.llm = llm
+        self.tokens = tokens
+        self.state = state
+
+
+class PrefixCache:
+    """
+    Keeps the llama.cpp KV state for a fixed prompt prefix so each generation only
+    evaluates the variable suffix. llama.cpp reuses the longest common prefix between
+    its current input and a new prompt, so restoring the snapshot before a call is
+    enough for the prefix tokens to be skipped.
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self._snapshots: Dict[int, _Snapshot] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def supports(llm) -> bool:
+        return all(hasattr(llm, attr) for attr in ("tokenize", "eval", "save_state", "load_state", "reset"))
+
+    def prepare(self, llm):
+        """Leave llm's KV cache holding the evaluated prefix. Caller must hold the model lock."""
+        if hasattr(llm, "use_prefix"):
+            # Out-of-process replicas keep their own snapshots; tell them which one to use
+            llm.use_prefix(self.prefix)
+            return
+        if not self.supports(llm):
+            return
+        with self._lock:
+            snapshot = self._snapshots.get(id(llm))
+        if snapshot is None or snapshot.llm is not llm:
+            self._build(llm)
+            return
+        n = len(snapshot.tokens)
+        if llm.n_tokens < n or list(llm.input_ids[:n]) != snapshot.tokens:
+            llm.load_state(snapshot.state)
+        self._record(hit=True)
+
+    def _build(self, llm):
+        started = time.perf_counter()
+        tokens = list(llm.tokenize(self.prefix.encode("utf-8")))
+        llm.reset()
+        llm.eval(tokens)
+        snapshot = _Snapshot(llm, tokens, llm.save_state())
+        with self._lock:
+            self._snapshots[id(llm)] = snapshot
+        logger.info(f"Cached {len(tokens)} prompt prefix tokens in {time.perf_counter() - started:.2f}s")
+        self._record(hit=False)
+
+    def _record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        metrics.incr("llm_prefix_cache_hits_total" if hit else "llm_prefix_cache_misses_total")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "snapshots": len(self._snapshots)}
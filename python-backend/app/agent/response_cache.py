@@ -0,0 +1,144 @@
+import asyncio
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+from ..metrics import metrics
+from .inference_scheduler import GenerationCancelled
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+class ResponseCache:
+    """
+    Bounded LRU + TTL cache for LLM fallback replies with single-flight coalescing:
+    concurrent requests for the same key share one in-flight generation. Only used
+    from the event loop, so no locking is needed.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(message: str, context: str) -> str:
+        normalized = " ".join(_PUNCTUATION.sub("", message.lower()).split())
+        return f"{normalized}|{hashlib.sha1(context.encode('utf-8')).hexdigest()}"
+
+    @staticmethod
+    def _size(key: str, value: str) -> int:
+        return len(key.encode("utf-8")) + len(value.encode("utf-8"))
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: str):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._bytes += self._size(key, value)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+        self._update_gauges()
+
+    def _remove(self, key: str):
+        _, value = self._entries.pop(key)
+        self._bytes -= self._size(key, value)
+        self._update_gauges()
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+        self._update_gauges()
+
+    def _update_gauges(self):
+        metrics.set_gauge("llm_cache_entries", len(self._entries))
+        metrics.set_gauge("llm_cache_bytes", self._bytes)
+
+    def lookup(self, key: str) -> Optional[str]:
+        """get() that also records a hit or miss"""
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            metrics.incr("llm_cache_hits_total")
+        else:
+            self.misses += 1
+            metrics.incr("llm_cache_misses_total")
+        metrics.set_gauge("llm_cache_hit_rate", self.hits / (self.hits + self.misses))
+        return value
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[str]], looked_up: bool = False) -> str:
+        """looked_up: the caller already missed on lookup(); check again without counting a second miss"""
+        value = self.get(key) if looked_up else self.lookup(key)
+        if value is not None:
+            return value
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            metrics.incr("llm_cache_coalesced_total")
+            try:
+                # Shield so a follower disconnecting does not cancel the leader's generation
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # The leader went away or timed out before finishing; generate for ourselves
+                return await self.get_or_compute(key, compute)
+        future = asyncio.get_running_loop().create_future()
+        # Avoid "exception never retrieved" warnings when nobody is waiting on the leader
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            value = await compute()
+            self.put(key, value)
+            future.set_result(value)
+            return value
+        except (asyncio.CancelledError, GenerationCancelled):
+            # Followers belong to other clients; they regenerate rather than inherit this cancellation
+            future.cancel()
+            raise
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "inflight": len(self._inflight),
+        }
+
+
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("LLM_CACHE_SIZE", "256")),
+    ttl_seconds=float(os.getenv("LLM_CACHE_TTL_SECONDS", "600")),
+)
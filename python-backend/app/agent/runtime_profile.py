@@ -0,0 +1,148 @@
+import json
+import logging
+import os
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Mapping, Optional
+
+from ..metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "huggingface", "hub", "models--TheBloke--Mistral-7B-Instruct-v0.2-GGUF",
+    "snapshots", "3a6fbf4a41a1d52e415a4958cde6856d34b2db93"
+)
+MODEL_FILE_TEMPLATE = "mistral-7b-instruct-v0.2.{quantization}.gguf"
+# Quantizations TheBloke publishes for Mistral 7B Instruct v0.2
+QUANTIZATIONS = ("Q2_K", "Q3_K_S", "Q3_K_M", "Q3_K_L", "Q4_0", "Q4_K_S", "Q4_K_M",
+                 "Q5_0", "Q5_K_S", "Q5_K_M", "Q6_K", "Q8_0")
+# Mistral 7B v0.2 was trained with a 32k context
+MAX_CONTEXT = 32768
+
+
+class RuntimeProfileError(ValueError):
+    """Raised at startup when the inference settings are invalid"""
+
+
+@dataclass(frozen=True)
+class RuntimeProfile:
+    """How llama.cpp runs the model on this host"""
+    model_path: str
+    quantization: str = "Q4_K_M"
+    n_ctx: int = 2048
+    n_threads: int = 1
+    n_threads_batch: int = 1
+    n_batch: int = 512
+    use_mmap: bool = True
+    use_mlock: bool = False
+
+    def llama_kwargs(self) -> Dict:
+        return {
+            "model_path": self.model_path, "n_ctx": self.n_ctx, "n_threads": self.n_threads,
+            "n_threads_batch": self.n_threads_batch, "n_batch": self.n_batch,
+            "use_mmap": self.use_mmap, "use_mlock": self.use_mlock,
+        }
+
+    def describe(self) -> str:
+        return (f"{self.quantization} n_ctx={self.n_ctx} n_threads={self.n_threads} "
+                f"n_threads_batch={self.n_threads_batch} n_batch={self.n_batch} "
+                f"mmap={self.use_mmap} mlock={self.use_mlock} ({self.model_path})")
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), indent=2)
+
+
+def _flag(value: str) -> bool:
+    return value.lower() in ("1", "true", "yes")
+
+
+_FIELDS = {
+    # env var: (profile field, parser)
+    "LLM_QUANTIZATION": ("quantization", str.upper),
+    "LLM_N_CTX": ("n_ctx", int),
+    "LLM_N_THREADS": ("n_threads", int),
+    "LLM_N_THREADS_BATCH": ("n_threads_batch", int),
+    "LLM_N_BATCH": ("n_batch", int),
+    "LLM_USE_MMAP": ("use_mmap", _flag),
+    "LLM_USE_MLOCK": ("use_mlock", _flag),
+}
+
+
+def default_threads(replicas: int = 1) -> int:
+    """Physical cores are roughly half the logical ones; split them between replicas"""
+    return max(1, (os.cpu_count() or 2) // 2 // max(1, replicas))
+
+
+def load_profile(env: Mapping[str, str] = os.environ, replicas: int = 1) -> RuntimeProfile:
+    """
+    Build the profile from defaults, then the JSON file named by LLM_PROFILE_FILE (as
+    written by benchmarks/bench_runtime_profile.py), then individual LLM_* variables.
+    """
+    threads = default_threads(replicas)
+    values: Dict = {"n_threads": threads, "n_threads_batch": threads}
+    profile_file = env.get("LLM_PROFILE_FILE")
+    if profile_file:
+        try:
+            with open(profile_file) as f:
+                values.update(json.load(f))
+        except (OSError, ValueError) as e:
+            raise RuntimeProfileError(f"Could not read LLM_PROFILE_FILE {profile_file}: {str(e)}")
+    for name, (field, parse) in _FIELDS.items():
+        if env.get(name):
+            try:
+                values[field] = parse(env[name])
+            except ValueError:
+                raise RuntimeProfileError(f"{name} has an invalid value: {env[name]!r}")
+    if "LLM_N_THREADS" in env and "LLM_N_THREADS_BATCH" not in env:
+        values["n_threads_batch"] = values["n_threads"]
+    if env.get("MISTRAL_MODEL_PATH"):
+        values["model_path"] = env["MISTRAL_MODEL_PATH"]
+        if "quantization" not in values:
+            # Read it from the file name, e.g. mistral-7b-instruct-v0.2.Q5_K_M.gguf
+            name = os.path.basename(values["model_path"]).upper()
+            values["quantization"] = next((q for q in QUANTIZATIONS if f".{q}." in name), RuntimeProfile.quantization)
+    quantization = values.get("quantization", RuntimeProfile.quantization)
+    if "model_path" not in values:
+        model_dir = env.get("MISTRAL_MODEL_DIR", DEFAULT_MODEL_DIR)
+        values["model_path"] = os.path.join(model_dir, MODEL_FILE_TEMPLATE.format(quantization=quantization))
+    try:
+        return RuntimeProfile(**values)
+    except TypeError as e:
+        raise RuntimeProfileError(f"Unknown runtime profile setting: {str(e)}")
+
+
+def validate(profile: RuntimeProfile, replicas: int = 1) -> List[str]:
+    """Raise RuntimeProfileError for settings llama.cpp would reject; return warnings for wasteful ones"""
+    errors, warnings = [], []
+    if profile.quantization not in QUANTIZATIONS:
+        errors.append(f"quantization {profile.quantization} is not one of {', '.join(QUANTIZATIONS)}")
+    if not 512 <= profile.n_ctx <= MAX_CONTEXT:
+        errors.append(f"n_ctx must be between 512 and {MAX_CONTEXT}, got {profile.n_ctx}")
+    if not 1 <= profile.n_batch <= profile.n_ctx:
+        errors.append(f"n_batch must be between 1 and n_ctx ({profile.n_ctx}), got {profile.n_batch}")
+    for field in ("n_threads", "n_threads_batch"):
+        if getattr(profile, field) < 1:
+            errors.append(f"{field} must be at least 1, got {getattr(profile, field)}")
+    if errors:
+        raise RuntimeProfileError("Invalid LLM runtime profile: " + "; ".join(errors))
+    cores = os.cpu_count() or 1
+    if profile.n_threads * replicas > cores:
+        warnings.append(f"{replicas} replica(s) x {profile.n_threads} threads oversubscribes {cores} CPUs")
+    if profile.use_mlock and not profile.use_mmap:
+        warnings.append("use_mlock without use_mmap locks a private copy of the weights in every process")
+    if not os.path.exists(profile.model_path):
+        warnings.append(f"model file not found at {profile.model_path}")
+    return warnings
+
+
+def record(profile: RuntimeProfile, warnings: Optional[List[str]] = None):
+    logger.info(f"LLM runtime profile: {profile.describe()}")
+    for warning in warnings or []:
+        logger.warning(f"LLM runtime profile: {warning}")
+    metrics.set_gauge("llm_profile_n_ctx", profile.n_ctx)
+    metrics.set_gauge("llm_profile_n_threads", profile.n_threads)
+    metrics.set_gauge("llm_profile_n_threads_batch", profile.n_threads_batch)
+    metrics.set_gauge("llm_profile_n_batch", profile.n_batch)
+    metrics.set_gauge("llm_profile_use_mmap", int(profile.use_mmap))
+    metrics.set_gauge("llm_profile_use_mlock", int(profile.use_mlock))
+    metrics.set_gauge(f"llm_profile_quantization_{profile.quantization}", 1)
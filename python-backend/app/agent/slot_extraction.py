@@ -0,0 +1,198 @@
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from ..metrics import metrics
+from .intent_router import Intent
+from .temporal import parse_temporal
+
+logger = logging.getLogger(__name__)
+
+try:
+    from llama_cpp import LlamaGrammar
+except ImportError:
+    LlamaGrammar = None
+
+STRUCTURED_EXTRACTION = os.getenv("LLM_STRUCTURED_EXTRACTION", "true").lower() in ("1", "true", "yes")
+EXTRACTION_MAX_TOKENS = int(os.getenv("LLM_EXTRACTION_MAX_TOKENS", "64"))
+# Extracted frames remembered per message, so a repeated message is not extracted twice
+EXTRACTION_CACHE_SIZE = int(os.getenv("LLM_EXTRACTION_CACHE_SIZE", "1024"))
+
+INTENTS = ("book", "reschedule", "cancel", "list", "availability", "other")
+
+# Fixed key order keeps the grammar small and the output a few dozen tokens long
+SLOT_GRAMMAR = r'''
+root   ::= "{" ws "\"intent\":" ws intent "," ws "\"doctor\":" ws value "," ws "\"date\":" ws value "," ws "\"time\":" ws value "," ws "\"reason\":" ws value "," ws "\"appointment_id\":" ws id ws "}"
+intent ::= ''' + " | ".join(f'"\\"{name}\\""' for name in INTENTS) + r'''
+value  ::= "null" | "\"" char* "\""
+char   ::= [^"\\\n]
+id     ::= "null" | [1-9] [0-9]*
+ws     ::= [ ]?
+'''
+
+# Static instructions first so the prefix KV state can be reused, as for the chat prompt
+EXTRACTION_PREFIX = (
+    "Extract the appointment request in the user's message as JSON with the keys intent, doctor, date, "
+    "time, reason and appointment_id. intent is one of book, reschedule, cancel, list, availability (asking "
+    "when a doctor is free) or other. Copy the doctor's name, date and time as the user wrote them (e.g. "
+    "\"Dr. Smith\", \"next Monday\", \"3pm\"). Use null for anything the user did not say.\n\n"
+)
+EXTRACTION_TEMPLATE = EXTRACTION_PREFIX + "Message: {message}\nJSON: "
+
+_grammar = None
+_grammar_lock = threading.Lock()
+
+
+def slot_grammar():
+    """The compiled GBNF grammar, or None when llama-cpp-python is unavailable"""
+    global _grammar
+    if _grammar is None and LlamaGrammar is not None:
+        with _grammar_lock:
+            if _grammar is None:
+                _grammar = LlamaGrammar.from_string(SLOT_GRAMMAR, verbose=False)
+    return _grammar
+
+
+@dataclass
+class SlotFrame:
+    intent: str
+    doctor: Optional[str] = None
+    date: Optional[str] = None
+    time: Optional[str] = None
+    reason: Optional[str] = None
+    appointment_id: Optional[int] = None
+
+
+def parse_slot_frame(text: str) -> Optional[SlotFrame]:
+    """Validate the model's JSON; the grammar guarantees the shape, but unconstrained models do not"""
+    try:
+        data = json.loads(text.strip())
+        frame = SlotFrame(
+            intent=data["intent"],
+            doctor=data.get("doctor") or None,
+            date=data.get("date") or None,
+            time=data.get("time") or None,
+            reason=data.get("reason") or None,
+            appointment_id=int(data["appointment_id"]) if data.get("appointment_id") is not None else None,
+        )
+    except (ValueError, KeyError, TypeError, AttributeError):
+        metrics.incr("llm_extraction_invalid_total")
+        logger.warning(f"Discarding malformed slot extraction: {text!r}")
+        return None
+    if frame.intent not in INTENTS:
+        metrics.incr("llm_extraction_invalid_total")
+        return None
+    metrics.incr(f"llm_extraction_{frame.intent}_total")
+    return frame
+
+
+# Words and entities without which a message cannot be an actionable request
+_SCHEDULING_HINTS = re.compile(
+    r"\b(?:book|appoint|schedul|reschedul|cancel|postpone|move|change|dr|doctor|visit|slot|availab|free|open"
+    r"|consult|check|list|show)|\d",
+    re.IGNORECASE
+)
+
+
+def worth_extracting(message: str) -> bool:
+    """
+    Cheap pre-check before spending a model call on extraction: the message must
+    mention a scheduling keyword, a number or a date/time. Chit-chat goes straight
+    to the (cached) conversational reply.
+    """
+    return bool(_SCHEDULING_HINTS.search(message)) or parse_temporal(message) is not None
+
+
+class FrameCache:
+    """LRU of extracted frames by message text; "other" frames included, so chit-chat is extracted once"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, SlotFrame]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(message: str) -> str:
+        return " ".join(message.lower().split())
+
+    def get(self, message: str) -> Optional[SlotFrame]:
+        key = self.make_key(message)
+        with self._lock:
+            frame = self._entries.get(key)
+            if frame is not None:
+                self._entries.move_to_end(key)
+        metrics.incr("llm_extraction_cache_hits_total" if frame is not None else "llm_extraction_cache_misses_total")
+        return frame
+
+    def put(self, message: str, frame: SlotFrame):
+        key = self.make_key(message)
+        with self._lock:
+            self._entries[key] = frame
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+frame_cache = FrameCache(EXTRACTION_CACHE_SIZE)
+
+
+def _doctor_names(doctor: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    if not doctor:
+        return None, None
+    words = [w for w in doctor.replace(".", " ").split() if w.lower() not in ("dr", "doctor")]
+    if not words:
+        return None, None
+    return words[0], (words[-1] if len(words) > 1 else None)
+
+
+def _clarify(text: str) -> Intent:
+    return Intent("clarify", {"text": text})
+
+
+def frame_to_intent(frame: SlotFrame, message: str) -> Optional[Intent]:
+    """
+    Map an extracted frame onto the slots the regex-routed handlers already take.
+    Missing required slots become a clarifying question instead of a second LLM call;
+    "other" returns None so the caller falls back to a conversational reply.
+    """
+    first, last = _doctor_names(frame.doctor)
+    when = " ".join(part for part in (frame.date, frame.time) if part)
+    if frame.intent == "book":
+        missing = [name for name, value in (("doctor", first), ("date", frame.date), ("time", frame.time)) if not value]
+        if missing:
+            listed = " and ".join([", ".join(missing[:-1]), missing[-1]]) if len(missing) > 1 else missing[0]
+            return _clarify(f"To book an appointment, please tell me the {listed}.")
+        return Intent("book_appointment", {
+            "doctor_first": first, "doctor_last": last, "date_token": frame.date, "date_text": when,
+            "hour": None, "minute": None, "ampm": None,
+            "reason": frame.reason or "Scheduled via agent", "message": message,
+        })
+    if frame.intent == "reschedule":
+        if not when:
+            return _clarify("When would you like to reschedule your appointment to?")
+        if frame.appointment_id:
+            return Intent("change_appointment", {"appointment_id": str(frame.appointment_id), "when": when})
+        return Intent("reschedule_my_appointment", {"doctor_first": first, "doctor_last": last, "when": when})
+    if frame.intent == "cancel":
+        if not first:
+            return _clarify("Which doctor's appointment would you like to cancel?")
+        return Intent("cancel_appointment", {
+            "action": "cancel", "doctor_first": first, "doctor_last": last, "when": when,
+            "mentions_tomorrow": "tomorrow" in message.lower(),
+        })
+    if frame.intent == "availability":
+        if not first:
+            return _clarify("Which doctor's availability would you like to see?")
+        return Intent("doctor_availability", {"doctor_first": first, "doctor_last": last, "when": when})
+    if frame.intent == "list":
+        return Intent("list_appointments", {"verb": None, "status": None})
+    return None
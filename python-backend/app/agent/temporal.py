@@ -0,0 +1,205 @@
+import os
+import re
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Optional
+
+from dateutil import parser as date_parser
+
+from ..metrics import metrics
+
+
+@dataclass(frozen=True)
+class Temporal:
+    """A parsed scheduling expression; either part may be missing ("friday", "3pm")"""
+    date: Optional[date]
+    time: Optional[time]
+    source: str
+
+    def to_datetime(self, default_date: date, default_time: time = time(0, 0)) -> datetime:
+        return datetime.combine(self.date or default_date, self.time or default_time)
+
+
+_WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+_NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+}
+_RELATIVE_DAYS = {"today": 0, "tonight": 0, "tomorrow": 1, "day after tomorrow": 2}
+_PARTS_OF_DAY = {"morning": 9, "afternoon": 14, "evening": 18, "tonight": 19}
+_MONTH = (r"(jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?"
+          r"|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\.?")
+_MONTHS = {name: i for i, name in enumerate(
+    ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), start=1)}
+_ORDINAL = r"(?:st|nd|rd|th)?"
+
+_ISO_DATE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+# Slashed dates are day-first, as the agent has always read them
+_NUMERIC_DATE = re.compile(r"\b(\d{1,2})[/.](\d{1,2})[/.](\d{4}|\d{2})\b")
+_DAY_MONTH = re.compile(r"\b(\d{1,2})" + _ORDINAL + r"(?: of)? " + _MONTH + r",?(?: (\d{4}))?\b")
+_MONTH_DAY = re.compile(r"\b" + _MONTH + r" (\d{1,2})" + _ORDINAL + r"(?:,? (\d{4}))?\b")
+_RELATIVE = re.compile(r"\b(day after tomorrow|tomorrow|today|tonight)\b")
+_IN_DAYS = re.compile(r"\bin (\d+|" + "|".join(_NUMBER_WORDS) + r") (day|week)s?\b")
+_NEXT_WEEK = re.compile(r"\bnext week\b")
+_WEEKDAY = re.compile(r"\b(?:(next|this|coming) )?(" + "|".join(_WEEKDAYS) + r")\b")
+_DAY_OF_MONTH = re.compile(r"\bthe (\d{1,2})(?:st|nd|rd|th)\b")
+
+_CLOCK_TIME = re.compile(r"\b(\d{1,2}):(\d{2})\s*(am|pm)?\b")
+_MERIDIEM_TIME = re.compile(r"\b(\d{1,2})\s*(am|pm)\b")
+_NAMED_TIME = re.compile(r"\b(noon|midday|midnight)\b")
+# "at 3" but not the start of "at 2025-06-01"; the lookahead stops at date separators
+_AT_HOUR = re.compile(r"\bat (\d{1,2})(?: o'?clock)?\b(?![:/.-]\d)")
+_PART_OF_DAY = re.compile(r"\b(this )?(morning|afternoon|evening|tonight)\b")
+
+_MERIDIEM_SPELLINGS = re.compile(r"\b([ap])\.m\.")
+
+
+def _normalize(text: str) -> str:
+    return " ".join(_MERIDIEM_SPELLINGS.sub(r"\1m", text.lower()).split())
+
+
+def _year(token: Optional[str]) -> Optional[int]:
+    if token is None:
+        return None
+    year = int(token)
+    return year + 2000 if year < 100 else year
+
+
+def _upcoming(month: int, day: int, reference: date) -> date:
+    """A month and day without a year means their next occurrence"""
+    candidate = date(reference.year, month, day)
+    return candidate if candidate >= reference else date(reference.year + 1, month, day)
+
+
+def _match_date(text: str, reference: date) -> Optional[date]:
+    m = _ISO_DATE.search(text)
+    if m:
+        return date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+    m = _NUMERIC_DATE.search(text)
+    if m:
+        return date(_year(m.group(3)), int(m.group(2)), int(m.group(1)))
+    m = _DAY_MONTH.search(text)
+    if m:
+        day, month, year = int(m.group(1)), _MONTHS[m.group(2)[:3]], _year(m.group(3))
+        return date(year, month, day) if year else _upcoming(month, day, reference)
+    m = _MONTH_DAY.search(text)
+    if m:
+        month, day, year = _MONTHS[m.group(1)[:3]], int(m.group(2)), _year(m.group(3))
+        return date(year, month, day) if year else _upcoming(month, day, reference)
+    m = _RELATIVE.search(text)
+    if m:
+        return reference + timedelta(days=_RELATIVE_DAYS[m.group(1)])
+    m = _IN_DAYS.search(text)
+    if m:
+        count = int(m.group(1)) if m.group(1).isdigit() else _NUMBER_WORDS[m.group(1)]
+        return reference + timedelta(days=count * (7 if m.group(2) == "week" else 1))
+    if _NEXT_WEEK.search(text):
+        return reference + timedelta(days=7)
+    m = _WEEKDAY.search(text)
+    if m:
+        ahead = (_WEEKDAYS.index(m.group(2)) - reference.weekday()) % 7
+        if m.group(1) == "next" and ahead == 0:
+            ahead = 7
+        return reference + timedelta(days=ahead)
+    m = _DAY_OF_MONTH.search(text)
+    if m:
+        day = int(m.group(1))
+        if day >= reference.day:
+            return reference.replace(day=day)
+        next_month = (reference.replace(day=1) + timedelta(days=32)).replace(day=1)
+        return next_month.replace(day=day)
+    return None
+
+
+def _to_24h(hour: int, meridiem: Optional[str]) -> int:
+    if meridiem == "pm" and hour < 12:
+        return hour + 12
+    if meridiem == "am" and hour == 12:
+        return 0
+    return hour
+
+
+def _match_time(text: str, part_of_day: Optional[str]) -> Optional[time]:
+    m = _CLOCK_TIME.search(text)
+    if m:
+        hour, minute, meridiem = int(m.group(1)), int(m.group(2)), m.group(3)
+    else:
+        m = _MERIDIEM_TIME.search(text)
+        if m:
+            hour, minute, meridiem = int(m.group(1)), 0, m.group(2)
+        else:
+            m = _NAMED_TIME.search(text)
+            if m:
+                return time(0 if m.group(1) == "midnight" else 12, 0)
+            m = _AT_HOUR.search(text)
+            if not m:
+                return None
+            hour, minute, meridiem = int(m.group(1)), 0, None
+    if meridiem and not 1 <= hour <= 12:
+        return None
+    hour = _to_24h(hour, meridiem)
+    if meridiem is None and hour < 12 and part_of_day in ("afternoon", "evening", "tonight"):
+        # "3 in the afternoon"
+        hour += 12
+    return time(hour, minute)
+
+
+def _dateutil_fallback(text: str, reference: date) -> Optional[Temporal]:
+    """
+    The previous fuzzy dateutil path. Parsing against two unrelated defaults shows
+    which parts the text actually supplied.
+    """
+    first_default = datetime.combine(reference, time(0, 0))
+    second_default = datetime(reference.year + 1, reference.month % 12 + 1, 1, 13, 37)
+    try:
+        first = date_parser.parse(text, fuzzy=True, dayfirst=True, default=first_default)
+        second = date_parser.parse(text, fuzzy=True, dayfirst=True, default=second_default)
+    except (ValueError, OverflowError):
+        return None
+    has_date = first.date() == second.date()
+    has_time = first.hour == second.hour
+    if not has_date and not has_time:
+        return None
+    return Temporal(first.date() if has_date else None,
+                    time(first.hour, first.minute) if has_time else None, "dateutil")
+
+
+@lru_cache(maxsize=int(os.getenv("TEMPORAL_CACHE_SIZE", "1024")))
+def _parse(text: str, reference: date) -> Optional[Temporal]:
+    part = _PART_OF_DAY.search(text)
+    part_of_day = part.group(2) if part else None
+    try:
+        parsed_date = _match_date(text, reference)
+    except ValueError:
+        # A pattern matched an impossible date such as "31/02/2025"
+        parsed_date = None
+    try:
+        parsed_time = _match_time(text, part_of_day)
+    except ValueError:
+        parsed_time = None
+    if parsed_date is None and part and (part.group(1) or part_of_day == "tonight"):
+        # "this afternoon", "tonight"
+        parsed_date = reference
+    if parsed_time is None and part_of_day:
+        parsed_time = time(_PARTS_OF_DAY[part_of_day], 0)
+    if parsed_date is not None or parsed_time is not None:
+        metrics.incr("temporal_pattern_parses_total")
+        return Temporal(parsed_date, parsed_time, "pattern")
+    metrics.incr("temporal_dateutil_fallbacks_total")
+    return _dateutil_fallback(text, reference)
+
+
+def parse_temporal(text: str, reference: Optional[date] = None) -> Optional[Temporal]:
+    """
+    Parse a scheduling phrase ("next Monday at 3pm", "in 3 days", "5th June afternoon")
+    relative to the reference date (today by default). Results are memoized per
+    (phrase, reference date); dateutil is only consulted when no pattern matches.
+    """
+    if not text or not text.strip():
+        return None
+    return _parse(_normalize(text), reference or date.today())
+
+
+def cache_info():
+    return _parse.cache_info()
@@ -1,4 +1,5 @@
 from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from typing import List
@@ -13,6 +14,12 @@ from .database import SessionLocal, engine, Base
 from .database.init_db import init_db
 from .models import user, appointment
 from .agent.appointment_agent import AppointmentAgent
+from .agent import model_registry
+from .speech import whisper_registry
+from .speech.transcription_pool import get_transcription_pool
+from .agent.inference_scheduler import get_scheduler
+from .metrics import metrics
+from .tracing import TracingMiddleware, instrument_engine
 from .routers import appointments, users, doctors, agent
 from .routers import whisper as whisper_router
 from .routers import auth as auth_router
@@ -42,7 +49,11 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+# Per-request span timings; added last so it wraps CORS and times the whole request
+app.add_middleware(TracingMiddleware)
+instrument_engine(engine)
 
 # Include routers
 app.include_router(agent.router, prefix="/agent", tags=["agent"])
@@ -58,15 +69,31 @@ async def startup_event():
         logger.info("Initializing database...")
         init_db()
         logger.info("Database initialization completed")
+        model_registry.preload()
+        whisper_registry.preload()
     except Exception as e:
         logger.error(f"Error during startup: {str(e)}")
         logger.error(traceback.format_exc())
         raise
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    get_scheduler().shutdown()
+    get_transcription_pool().shutdown()
+    model_registry.shutdown()
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Appointment System API"}
 
+@app.get("/metrics")
+async def get_metrics():
+    return metrics.snapshot()
+
+@app.get("/metrics/prometheus", response_class=PlainTextResponse)
+async def get_prometheus_metrics():
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
 # Global exception handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
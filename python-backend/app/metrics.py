@@ -0,0 +1,97 @@
+import bisect
+import threading
+from collections import defaultdict
+from typing import Dict, List, Sequence
+
+# Latency buckets in seconds, from a cached regex reply to a long LLM generation
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class _Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[int]:
+        totals, running = [], 0
+        for count in self.counts:
+            running += count
+            totals.append(running)
+        return totals
+
+
+class MetricsRegistry:
+    """Thread-safe in-process counters, gauges and histograms, exposed on GET /metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._histograms: Dict[str, _Histogram] = {}
+
+    def incr(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name: str, value: float):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = _Histogram(buckets)
+            histogram.observe(value)
+
+    def get(self, name: str, default: float = 0):
+        with self._lock:
+            if name in self._gauges:
+                return self._gauges[name]
+            return self._counters.get(name, default)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "histograms": {
+                    name: {
+                        "buckets": dict(zip([str(b) for b in h.buckets] + ["+Inf"], h.cumulative())),
+                        "sum": h.sum,
+                        "count": h.count,
+                    }
+                    for name, h in self._histograms.items()
+                },
+            }
+
+    def render_prometheus(self) -> str:
+        """The registry in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, value in sorted(self._counters.items()):
+                lines += [f"# TYPE {name} counter", f"{name} {value}"]
+            for name, value in sorted(self._gauges.items()):
+                lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+            for name, h in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for bound, total in zip([str(b) for b in h.buckets] + ["+Inf"], h.cumulative()):
+                    lines.append(f'{name}_bucket{{le="{bound}"}} {total}')
+                lines += [f"{name}_sum {h.sum}", f"{name}_count {h.count}"]
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+metrics = MetricsRegistry()
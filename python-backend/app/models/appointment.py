@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, Index
 from sqlalchemy.orm import relationship
 import enum
 
@@ -12,6 +12,12 @@ class AppointmentStatus(enum.Enum):
 
 class Appointment(Base, TimestampMixin):
     __tablename__ = "appointments"
+    __table_args__ = (
+        # Overlap check: doctor_id = ? AND start_time < ? AND end_time > ?
+        Index("ix_appointments_doctor_start_end", "doctor_id", "start_time", "end_time"),
+        # A patient's appointments by status and date
+        Index("ix_appointments_user_status_start", "user_id", "status", "start_time"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
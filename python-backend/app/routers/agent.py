@@ -1,10 +1,15 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import Dict
+import asyncio
+import json
 import logging
+import os
 from pydantic import BaseModel
 from ..database import SessionLocal
 from ..agent.appointment_agent import AppointmentAgent
+from ..agent.inference_scheduler import SchedulerFullError, CancelToken, GenerationCancelled
 from ..auth import get_current_user
 from ..models.user import User
 
@@ -14,6 +19,8 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "0.5"))
+
 # Pydantic models
 class ChatRequest(BaseModel):
     message: str
@@ -27,18 +34,79 @@ def get_db():
     finally:
         db.close()
 
+async def cancel_on_disconnect(http_request: Request, cancel: CancelToken):
+    """Cancel the request's generation as soon as the client goes away"""
+    while not cancel.cancelled:
+        if await http_request.is_disconnected():
+            logger.info("Client disconnected; cancelling generation")
+            cancel.cancel(CancelToken.DISCONNECTED)
+            return
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+
+def cancelled_http_exception(e: GenerationCancelled) -> HTTPException:
+    # 499 is the de-facto "client closed request" status; nobody reads it, but logs do
+    return HTTPException(status_code=504 if e.reason == CancelToken.TIMEOUT else 499, detail=str(e))
+
+
 @router.post("/chat")
-async def chat_with_agent(request: ChatRequest, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def chat_with_agent(request: ChatRequest, http_request: Request, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     """
     Chat with the appointment agent (requires authentication)
     """
+    agent = AppointmentAgent(db)
+    watcher = asyncio.create_task(cancel_on_disconnect(http_request, agent.cancel))
     try:
         logger.info(f"Received chat request: {request}")
-        agent = AppointmentAgent(db)
         response = await agent.process_message(request.message, current_user.id)
         logger.info(f"Agent response: {response}")
         return {"response": response}
+    except SchedulerFullError as e:
+        logger.warning(f"Rejected chat request: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except GenerationCancelled as e:
+        logger.warning(f"Chat generation stopped: {e.reason}")
+        raise cancelled_http_exception(e)
     except Exception as e:
         logger.error(f"Error in chat endpoint:) {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        watcher.cancel()
 
+
+async def _sse_events(frames):
+    """Encode agent (kind, text) frames as Server-Sent Events"""
+    try:
+        async for kind, text in frames:
+            yield f"event: {kind}\ndata: {json.dumps({'text': text})}\n\n"
+            if kind == "message":
+                return
+        yield "event: done\ndata: {}\n\n"
+    except Exception as e:
+        logger.error(f"Error while streaming agent reply: {str(e)}")
+        yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+
+@router.post("/chat/stream")
+async def stream_chat_with_agent(request: ChatRequest, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """
+    Chat with the appointment agent and receive the reply as Server-Sent Events (requires authentication).
+    Deterministic replies arrive as a single `message` event; LLM replies arrive as `token` events followed by `done`.
+    """
+    try:
+        logger.info(f"Received streaming chat request: {request}")
+        agent = AppointmentAgent(db)
+        frames = await agent.stream_message(request.message, current_user.id)
+    except SchedulerFullError as e:
+        logger.warning(f"Rejected streaming chat request: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except GenerationCancelled as e:
+        logger.warning(f"Streaming chat generation stopped: {e.reason}")
+        raise cancelled_http_exception(e)
+    except Exception as e:
+        logger.error(f"Error in streaming chat endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return StreamingResponse(
+        _sse_events(frames),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -9,6 +9,7 @@ from ..models.appointment import Appointment, AppointmentStatus
 from ..models.user import User, UserRole
 from ..models.doctor import Doctor
 from ..auth import get_current_user
+from ..agent.booking import book_appointment, set_status, DoctorNotFound, SlotUnavailable, BookingBusy
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -79,10 +80,13 @@ async def get_appointment(appointment_id: int, db: Session = Depends(get_db), cu
         logger.error(f"Error getting appointment: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# A plain def: FastAPI runs it in its threadpool, since the booking service blocks while it waits for the slot
 @router.post("/", response_model=AppointmentRead)
-async def create_appointment(appointment_data: AppointmentCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def create_appointment(appointment_data: AppointmentCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     try:
-        appointment = Appointment(
+        # Goes through the booking service so the overlap check and insert are atomic
+        return book_appointment(
+            db,
             user_id=appointment_data.user_id,
             doctor_id=appointment_data.doctor_id,
             start_time=appointment_data.start_time,
@@ -90,27 +94,46 @@ async def create_appointment(appointment_data: AppointmentCreate, db: Session =
             reason=appointment_data.reason,
             status=AppointmentStatus(appointment_data.status)
         )
-        db.add(appointment)
-        db.commit()
-        db.refresh(appointment)
-        return appointment
+    except DoctorNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except SlotUnavailable as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except BookingBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error creating appointment: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# A plain def like create_appointment: reactivating a cancelled appointment books its slot again
 @router.put("/{appointment_id}", response_model=AppointmentRead)
-async def update_appointment(appointment_id: int, appointment_data: AppointmentUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def update_appointment(appointment_id: int, appointment_data: AppointmentUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     try:
         appointment = db.query(Appointment).filter(Appointment.id == appointment_id).first()
         if not appointment:
             raise HTTPException(status_code=404, detail="Appointment not found")
         update_dict = appointment_data.dict(exclude_unset=True)
+        status = update_dict.pop("status", None)
         for key, value in update_dict.items():
             if hasattr(appointment, key):
                 setattr(appointment, key, value)
+        if status is not None:
+            # Goes through the booking service, which commits the other fields with it
+            return set_status(db, appointment, AppointmentStatus(status))
         db.commit()
         db.refresh(appointment)
         return appointment
+    except HTTPException:
+        raise
+    except DoctorNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except SlotUnavailable as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except BookingBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error updating appointment: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
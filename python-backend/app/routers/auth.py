@@ -5,6 +5,7 @@ from datetime import timedelta
 from ..database import SessionLocal
 from ..models.user import User, UserRole
 from ..auth import authenticate_user, create_access_token, get_password_hash, get_current_user
+from ..agent.doctor_index import doctor_index
 
 router = APIRouter()
 
@@ -56,6 +57,7 @@ def register(request: RegisterRequest, db: Session = Depends(get_db)):
     db.add(user)
     db.commit()
     db.refresh(user)
+    doctor_index.on_user_saved(user)
     access_token = create_access_token(data={"sub": str(user.id)})  # Ensure sub is a string
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -1,12 +1,16 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from datetime import date, datetime, timedelta
+from dataclasses import replace
 import logging
 from pydantic import BaseModel
 from ..database import SessionLocal
 from ..models.user import User, UserRole
 from ..models.doctor import Doctor
 from ..auth import get_current_user
+from ..agent.doctor_index import doctor_index
+from ..agent.availability import WorkingHours, AVAILABILITY_MAX_DAYS, AVAILABILITY_MAX_SLOTS, find_availability, day_range
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -33,6 +37,17 @@ class DoctorRead(BaseModel):
     class Config:
         orm_mode = True
 
+class SlotRead(BaseModel):
+    start: datetime
+    end: datetime
+
+class AvailabilityRead(BaseModel):
+    doctor_id: int
+    start: date
+    end: date
+    slot_minutes: int
+    slots: List[SlotRead]
+
 # Dependency to get database session
 def get_db():
     db = SessionLocal()
@@ -63,6 +78,40 @@ async def get_doctor(doctor_id: int, db: Session = Depends(get_db), current_user
         logger.error(f"Error getting doctor: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/{doctor_id}/availability", response_model=AvailabilityRead)
+async def get_doctor_availability(
+    doctor_id: int,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    slot_minutes: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=AVAILABILITY_MAX_SLOTS),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Free slots of a doctor from start to end (inclusive; defaults to the next 7 days)"""
+    start = start or date.today()
+    end = end or start + timedelta(days=6)
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    if (end - start).days >= AVAILABILITY_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"At most {AVAILABILITY_MAX_DAYS} days can be searched at once")
+    if slot_minutes is not None and not 5 <= slot_minutes <= 240:
+        raise HTTPException(status_code=400, detail="slot_minutes must be between 5 and 240")
+    try:
+        doctor = db.query(Doctor).filter(Doctor.id == doctor_id).first()
+        if not doctor:
+            raise HTTPException(status_code=404, detail="Doctor not found")
+        hours = replace(WorkingHours(), slot_minutes=slot_minutes) if slot_minutes else WorkingHours()
+        range_start, range_end = day_range(start, end)
+        slots = find_availability(db, doctor_id, range_start, range_end, hours, limit)
+        return AvailabilityRead(doctor_id=doctor_id, start=start, end=end, slot_minutes=hours.slot_minutes,
+                                slots=[SlotRead(start=s.start, end=s.end) for s in slots])
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting doctor availability: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/", response_model=DoctorRead)
 async def create_doctor(doctor_data: DoctorCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     """Create a new doctor profile"""
@@ -86,6 +135,7 @@ async def create_doctor(doctor_data: DoctorCreate, db: Session = Depends(get_db)
         db.add(doctor)
         db.commit()
         db.refresh(doctor)
+        doctor_index.on_doctor_saved(doctor)
         return doctor
     except Exception as e:
         logger.error(f"Error creating doctor: {str(e)}")
@@ -119,6 +169,7 @@ async def delete_doctor(doctor_id: int, db: Session = Depends(get_db), current_u
             raise HTTPException(status_code=404, detail="Doctor not found")
         db.delete(doctor)
         db.commit()
+        doctor_index.on_doctor_deleted(doctor_id)
         return {"message": "Doctor profile deleted successfully"}
     except Exception as e:
         logger.error(f"Error deleting doctor: {str(e)}")
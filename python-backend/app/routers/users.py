@@ -6,6 +6,7 @@ from pydantic import BaseModel
 from ..database import SessionLocal
 from ..models.user import User, UserRole
 from ..auth import get_password_hash
+from ..agent.doctor_index import doctor_index
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -92,6 +93,7 @@ async def create_user(user_data: UserCreate, db: Session = Depends(get_db)):
         db.add(user)
         db.commit()
         db.refresh(user)
+        doctor_index.on_user_saved(user)
         
         return user
     except Exception as e:
@@ -114,6 +116,7 @@ async def update_user(user_id: int, user_data: UserUpdate, db: Session = Depends
 
         db.commit()
         db.refresh(user)
+        doctor_index.on_user_saved(user)
         return user
     except Exception as e:
         logger.error(f"Error updating user: {str(e)}")
@@ -129,6 +132,7 @@ async def delete_user(user_id: int, db: Session = Depends(get_db)):
 
         db.delete(user)
         db.commit()
+        doctor_index.on_user_deleted(user_id)
         return {"message": "User deleted successfully"}
     except Exception as e:
         logger.error(f"Error deleting user: {str(e)}")
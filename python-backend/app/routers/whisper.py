@@ -1,41 +1,130 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form
+import asyncio
+import json
+import logging
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form, Request, WebSocket, WebSocketDisconnect, Query
 from sqlalchemy.orm import Session
-import whisper
-import tempfile
 from ..database import SessionLocal
-from .agent import router as agent_router
+from .agent import router as agent_router, cancel_on_disconnect, cancelled_http_exception
 from ..agent.appointment_agent import AppointmentAgent
+from ..agent.inference_scheduler import SchedulerFullError, GenerationCancelled, PRIORITY_HIGH
 from ..auth import get_current_user
+from ..speech.transcription import transcribe_clip
+from ..speech.transcription_pool import TranscriptionQueueFull
+from ..speech.vad import NoSpeechDetected
+from ..speech.audio import decode_upload, AudioDecodeError, AudioTooLargeError, SAMPLE_RATE
+from ..speech.streaming import VoiceStream
+from ..metrics import metrics
+from ..tracing import span
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+
+def audio_http_exception(e: AudioDecodeError) -> HTTPException:
+    return HTTPException(status_code=413 if isinstance(e, AudioTooLargeError) else 400, detail=str(e))
+
+
 @router.post("/transcribe")
 async def transcribe_audio(file: UploadFile = File(...)):
     try:
-        model = whisper.load_model("base")  # or "small", "medium", "large"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
-            tmp.write(await file.read())
-            tmp_path = tmp.name
-        result = model.transcribe(tmp_path)
-        return {"transcription": result["text"]}
+        # Decoded in memory; silence is trimmed before the shared model runs off the event loop
+        with span("upload"):
+            audio = await decode_upload(file)
+        transcript = await transcribe_clip(audio)
+        return {"transcription": transcript.text, "audio_seconds_saved": round(transcript.audio_seconds_saved, 2)}
+    except NoSpeechDetected as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except TranscriptionQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except AudioDecodeError as e:
+        raise audio_http_exception(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/voice-agent")
 async def voice_agent_reply(
+    http_request: Request,
     file: UploadFile = File(...),
     db: Session = Depends(lambda: SessionLocal()),
     current_user = Depends(get_current_user)
 ):
     try:
-        model = whisper.load_model("base")
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
-            tmp.write(await file.read())
-            tmp_path = tmp.name
-        result = model.transcribe(tmp_path)
-        transcription = result["text"]
-        agent = AppointmentAgent(db)
-        agent_reply = await agent.process_message(transcription, current_user.id)
-        return {"transcription": transcription, "agent_reply": agent_reply}
+        with span("upload"):
+            audio = await decode_upload(file)
+        transcript = await transcribe_clip(audio)
+        transcription = transcript.text
+        # Voice users have already waited for transcription, so they go ahead of text chat
+        agent = AppointmentAgent(db, priority=PRIORITY_HIGH)
+        watcher = asyncio.create_task(cancel_on_disconnect(http_request, agent.cancel))
+        try:
+            with span("agent"):
+                agent_reply = await agent.process_message(transcription, current_user.id)
+        finally:
+            watcher.cancel()
+        return {"transcription": transcription, "agent_reply": agent_reply,
+                "audio_seconds_saved": round(transcript.audio_seconds_saved, 2)}
+    except (SchedulerFullError, TranscriptionQueueFull) as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except GenerationCancelled as e:
+        raise cancelled_http_exception(e)
+    except NoSpeechDetected as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except AudioDecodeError as e:
+        raise audio_http_exception(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.websocket("/stream")
+async def voice_stream(websocket: WebSocket, token: str = Query(...), sample_rate: int = Query(SAMPLE_RATE, ge=8000, le=48000)):
+    """
+    Streaming voice agent. The client sends 16-bit little-endian mono PCM as binary
+    messages while the user speaks (and may send {"type": "end"} when they stop);
+    the server sends {"type": "partial"|"final"|"reply"|"error", ...} messages.
+    sample_rate outside 8-48 kHz is refused (close code 1008) before the socket is accepted.
+    """
+    db = SessionLocal()
+    try:
+        # Browsers cannot set headers on a WebSocket, so the access token comes in the query string
+        try:
+            current_user = get_current_user(token=token, db=db)
+        except HTTPException:
+            await websocket.close(code=1008)
+            return
+        await websocket.accept()
+
+        async def reply_to(transcription: str):
+            agent = AppointmentAgent(db, priority=PRIORITY_HIGH)
+            try:
+                return await agent.process_message(transcription, current_user.id)
+            except SchedulerFullError as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+            except GenerationCancelled as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+
+        stream = VoiceStream(websocket.send_json, reply_to, sample_rate=sample_rate)
+        metrics.incr("voice_stream_sessions_total")
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes"):
+                    await stream.feed(message["bytes"])
+                elif message.get("text"):
+                    try:
+                        control = json.loads(message["text"])
+                    except ValueError:
+                        continue
+                    if isinstance(control, dict) and control.get("type") == "end" and not stream.end_utterance():
+                        # No speech was heard, so there is nothing to transcribe
+                        await websocket.send_json({"type": "final", "text": ""})
+        except WebSocketDisconnect:
+            pass
+        finally:
+            # Cancels transcriptions and any agent reply still running for this client
+            await stream.close()
+            logger.info("Voice stream closed")
+    finally:
+        db.close()
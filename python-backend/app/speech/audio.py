@@ -0,0 +1,233 @@
+import logging
+import os
+import shutil
+import struct
+import subprocess
+import threading
+from typing import List, Optional
+
+import numpy as np
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+from ..metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Whisper works on 16 kHz mono float32 in [-1, 1]
+SAMPLE_RATE = 16000
+# Uploads larger than this are decoded while they are read instead of buffered whole
+AUDIO_STREAM_THRESHOLD_BYTES = int(os.getenv("AUDIO_STREAM_THRESHOLD_BYTES", str(2 * 1024 * 1024)))
+AUDIO_CHUNK_BYTES = int(os.getenv("AUDIO_CHUNK_BYTES", str(256 * 1024)))
+AUDIO_MAX_UPLOAD_BYTES = int(os.getenv("AUDIO_MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+
+_WAVE_FORMAT_PCM = 1
+_WAVE_FORMAT_FLOAT = 3
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class AudioDecodeError(ValueError):
+    """The upload is not audio we can decode"""
+
+
+class AudioTooLargeError(AudioDecodeError):
+    """The upload is over AUDIO_MAX_UPLOAD_BYTES"""
+
+
+def pcm16_to_float(data: bytes) -> np.ndarray:
+    """Little-endian 16-bit PCM to float32 in [-1, 1]"""
+    return np.frombuffer(data[:len(data) - len(data) % 2], dtype="<i2").astype(np.float32) / 32768.0
+
+
+def resample(audio: np.ndarray, rate: int) -> np.ndarray:
+    """Linear-interpolation resampling to 16 kHz; plenty for speech recognition"""
+    if rate == SAMPLE_RATE or not len(audio):
+        return audio.astype(np.float32, copy=False)
+    length = int(round(len(audio) * SAMPLE_RATE / rate))
+    positions = np.arange(length, dtype=np.float64) * (rate / SAMPLE_RATE)
+    return np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+
+
+def is_wav(header: bytes) -> bool:
+    return header[:4] == b"RIFF" and header[8:12] == b"WAVE"
+
+
+class WavDecoder:
+    """
+    Incremental decoder for PCM and float WAV files: parses the RIFF header, then
+    converts sample-aligned bytes as they arrive, so large uploads are never held
+    as one bytes object.
+    """
+
+    def __init__(self):
+        self._buffer = b""
+        self._format = None
+        self._in_data = False
+        self._remaining = None
+        self._blocks: List[np.ndarray] = []
+
+    def _parse_header(self) -> bool:
+        data = self._buffer
+        offset = 12
+        while offset + 8 <= len(data):
+            chunk_id, size = struct.unpack_from("<4sI", data, offset)
+            body = offset + 8
+            if chunk_id == b"data":
+                if self._format is None:
+                    raise AudioDecodeError("WAV data chunk before fmt chunk")
+                self._buffer = data[body:]
+                self._in_data = True
+                # Streaming writers put 0 or 0xFFFFFFFF here; read to the end then
+                self._remaining = size if 0 < size < 0xFFFFFFFF else None
+                return True
+            if body + size > len(data):
+                return False
+            if chunk_id == b"fmt ":
+                tag, channels, rate, _, _, bits = struct.unpack_from("<HHIIHH", data, body)
+                if tag == _WAVE_FORMAT_EXTENSIBLE and size >= 26:
+                    tag = struct.unpack_from("<H", data, body + 24)[0]
+                if tag not in (_WAVE_FORMAT_PCM, _WAVE_FORMAT_FLOAT) or bits not in (8, 16, 24, 32) or not channels:
+                    raise AudioDecodeError(f"Unsupported WAV encoding (format {tag}, {bits} bits)")
+                self._format = (tag, channels, rate, bits)
+            # Chunks are word-aligned
+            offset = body + size + (size & 1)
+        return False
+
+    def _convert(self, data: bytes) -> np.ndarray:
+        tag, channels, _, bits = self._format
+        if tag == _WAVE_FORMAT_FLOAT:
+            samples = np.frombuffer(data, dtype="<f4" if bits == 32 else "<f8").astype(np.float32)
+        elif bits == 8:
+            samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+        elif bits == 16:
+            samples = np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+        elif bits == 24:
+            raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+            values = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+            samples = np.where(values >= 1 << 23, values - (1 << 24), values).astype(np.float32) / float(1 << 23)
+        else:
+            samples = np.frombuffer(data, dtype="<i4").astype(np.float32) / float(1 << 31)
+        if channels > 1:
+            samples = samples.reshape(-1, channels).mean(axis=1)
+        return samples
+
+    def feed(self, data: bytes):
+        self._buffer += data
+        if not self._in_data and not self._parse_header():
+            return
+        if self._remaining is not None:
+            self._buffer = self._buffer[:self._remaining]
+        _, channels, _, bits = self._format
+        frame = channels * bits // 8
+        usable = len(self._buffer) - len(self._buffer) % frame
+        if usable:
+            self._blocks.append(self._convert(self._buffer[:usable]))
+            if self._remaining is not None:
+                self._remaining -= usable
+            self._buffer = self._buffer[usable:]
+
+    def finish(self) -> np.ndarray:
+        if not self._in_data:
+            raise AudioDecodeError("Truncated WAV header")
+        audio = np.concatenate(self._blocks) if self._blocks else np.zeros(0, dtype=np.float32)
+        return resample(audio, self._format[2])
+
+
+class FfmpegDecoder:
+    """
+    Decodes any container ffmpeg understands (the browser's webm/ogg recordings) over
+    pipes: compressed bytes go in on stdin and 16 kHz mono PCM comes back on stdout,
+    read by a thread so neither pipe can fill up and stall the other.
+    """
+
+    def __init__(self):
+        if not shutil.which("ffmpeg"):
+            raise AudioDecodeError("ffmpeg is required to decode this audio format")
+        self._process = subprocess.Popen(
+            ["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-threads", "0", "-i", "pipe:0",
+             "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE), "pipe:1"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+        self._output: List[bytes] = []
+        self._errors = b""
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        for block in iter(lambda: self._process.stdout.read(65536), b""):
+            self._output.append(block)
+
+    def feed(self, data: bytes):
+        try:
+            self._process.stdin.write(data)
+        except BrokenPipeError:
+            # ffmpeg gave up on the input; finish() reports why
+            pass
+
+    def finish(self) -> np.ndarray:
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self._errors = self._process.stderr.read()
+        self._process.wait()
+        self._reader.join()
+        if self._process.returncode != 0:
+            raise AudioDecodeError(f"Failed to decode audio: {self._errors.decode(errors='replace').strip()}")
+        return pcm16_to_float(b"".join(self._output))
+
+    def abort(self):
+        if self._process.poll() is None:
+            self._process.kill()
+        self._process.wait()
+
+
+def _decoder_for(header: bytes):
+    return WavDecoder() if is_wav(header) else FfmpegDecoder()
+
+
+def decode_audio(data: bytes) -> np.ndarray:
+    """Decode a complete audio file held in memory to 16 kHz mono float32"""
+    if not data:
+        raise AudioDecodeError("Empty audio upload")
+    decoder = _decoder_for(data)
+    decoder.feed(data)
+    return decoder.finish()
+
+
+async def decode_upload(file: UploadFile) -> np.ndarray:
+    """
+    Decode an uploaded audio file without touching the filesystem. Small uploads are
+    read whole; larger ones are fed to the decoder chunk by chunk as they are read.
+    Decoding runs in the threadpool so the event loop stays free.
+    """
+    size: Optional[int] = getattr(file, "size", None)
+    if size is not None and size > AUDIO_MAX_UPLOAD_BYTES:
+        raise AudioTooLargeError(f"Audio upload is larger than {AUDIO_MAX_UPLOAD_BYTES} bytes")
+    if size is not None and size <= AUDIO_STREAM_THRESHOLD_BYTES:
+        data = await file.read()
+        metrics.incr("audio_decoded_bytes_total", len(data))
+        return await run_in_threadpool(decode_audio, data)
+    first = await file.read(AUDIO_CHUNK_BYTES)
+    if not first:
+        raise AudioDecodeError("Empty audio upload")
+    decoder = await run_in_threadpool(_decoder_for, first)
+    total = len(first)
+    try:
+        await run_in_threadpool(decoder.feed, first)
+        while True:
+            chunk = await file.read(AUDIO_CHUNK_BYTES)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > AUDIO_MAX_UPLOAD_BYTES:
+                raise AudioTooLargeError(f"Audio upload is larger than {AUDIO_MAX_UPLOAD_BYTES} bytes")
+            await run_in_threadpool(decoder.feed, chunk)
+        audio = await run_in_threadpool(decoder.finish)
+    except Exception:
+        if isinstance(decoder, FfmpegDecoder):
+            decoder.abort()
+        raise
+    metrics.incr("audio_decoded_bytes_total", total)
+    metrics.incr("audio_streamed_uploads_total")
+    return audio
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, List, Optional
+
+import numpy as np
+
+from fastapi.concurrency import run_in_threadpool
+
+from ..metrics import metrics
+from .transcription import transcribe_segments
+from .audio import SAMPLE_RATE, pcm16_to_float, resample
+from .vad import Endpointer, FRAME_SAMPLES, NoSpeechDetected, frame_levels, preprocess
+
+logger = logging.getLogger(__name__)
+
+# Seconds of new speech between partial transcripts
+STREAM_PARTIAL_INTERVAL_SECONDS = float(os.getenv("STREAM_PARTIAL_INTERVAL_SECONDS", "1.0"))
+# Partial transcripts cover at most this much audio; older audio is transcribed once and kept
+STREAM_WINDOW_SECONDS = float(os.getenv("STREAM_WINDOW_SECONDS", "10"))
+# Trailing silence that ends an utterance
+STREAM_END_SILENCE_MS = int(os.getenv("STREAM_END_SILENCE_MS", "700"))
+STREAM_MAX_UTTERANCE_SECONDS = float(os.getenv("STREAM_MAX_UTTERANCE_SECONDS", "30"))
+# Audio kept from before speech starts so the first syllable is not clipped
+_PRE_ROLL_SECONDS = 0.3
+
+
+async def _transcribe(audio: np.ndarray) -> str:
+    """Transcribe a stretch of the stream; like uploads, it goes through VAD so silence never reaches Whisper"""
+    try:
+        vad = await run_in_threadpool(preprocess, audio)
+    except NoSpeechDetected:
+        return ""
+    return " ".join(text for text in await transcribe_segments(vad.segments) if text)
+
+
+class VoiceStream:
+    """
+    One streaming voice session. 16-bit PCM chunks are fed in as the user speaks;
+    an endpointer finds the utterance, partial transcripts of a sliding window are
+    sent while it grows, and at end-of-speech the full transcript is sent and handed
+    to `on_utterance`, whose reply is sent back. Utterances are handled one at a time.
+    """
+
+    def __init__(self, send: Callable[[dict], Awaitable], on_utterance: Callable[[str], Awaitable[Optional[str]]],
+                 sample_rate: int = SAMPLE_RATE):
+        self.send = send
+        self.on_utterance = on_utterance
+        self.sample_rate = sample_rate
+        self.endpointer = Endpointer(end_ms=STREAM_END_SILENCE_MS)
+        self._pre_roll = deque()
+        self._pre_roll_samples = 0
+        self._audio: List[np.ndarray] = []
+        self._samples = 0
+        # Start of the audio not yet covered by a committed transcript
+        self._window_start = 0
+        self._commits: List[asyncio.Task] = []
+        self._partial: Optional[asyncio.Task] = None
+        self._since_partial = 0
+        self._tasks = set()
+        self._turn_lock = asyncio.Lock()
+        self.active = False
+
+    async def feed(self, data: bytes):
+        chunk = resample(pcm16_to_float(data), self.sample_rate)
+        event = self.endpointer.feed(chunk)
+        if not self.active:
+            self._pre_roll.append(chunk)
+            self._pre_roll_samples += len(chunk)
+            while self._pre_roll_samples - len(self._pre_roll[0]) >= _PRE_ROLL_SECONDS * SAMPLE_RATE:
+                self._pre_roll_samples -= len(self._pre_roll.popleft())
+            if self.endpointer.in_speech:
+                self.active = True
+                self._audio = list(self._pre_roll)
+                self._samples = self._pre_roll_samples
+                self._pre_roll.clear()
+                self._pre_roll_samples = 0
+                self._since_partial = self._samples
+            return
+        self._audio.append(chunk)
+        self._samples += len(chunk)
+        self._since_partial += len(chunk)
+        if event == "end" or self._samples >= STREAM_MAX_UTTERANCE_SECONDS * SAMPLE_RATE:
+            self.end_utterance()
+            return
+        if self._samples - self._window_start > STREAM_WINDOW_SECONDS * SAMPLE_RATE:
+            self._commit()
+        if self._since_partial >= STREAM_PARTIAL_INTERVAL_SECONDS * SAMPLE_RATE and self._partial is None:
+            self._since_partial = 0
+            window = self._utterance()[self._window_start:]
+            self._partial = self._spawn(self._send_partial(window, list(self._commits)))
+
+    def _utterance(self) -> np.ndarray:
+        if len(self._audio) > 1:
+            self._audio = [np.concatenate(self._audio)]
+        return self._audio[0] if self._audio else np.zeros(0, dtype=np.float32)
+
+    def _spawn(self, coroutine) -> asyncio.Task:
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _commit(self):
+        """Slide the window: transcribe its older part once, cut at the quietest frame near its end"""
+        audio = self._utterance()
+        # Look for a pause in the last fifth of the window so words are not cut in half
+        search_start = self._window_start + int(STREAM_WINDOW_SECONDS * 0.8 * SAMPLE_RATE)
+        window_end = self._window_start + int(STREAM_WINDOW_SECONDS * SAMPLE_RATE)
+        levels = frame_levels(audio[search_start:window_end])
+        cut = search_start + int(np.argmin(levels)) * FRAME_SAMPLES if len(levels) else window_end
+        self._commits.append(self._spawn(_transcribe(audio[self._window_start:cut])))
+        self._window_start = cut
+
+    async def _send_partial(self, window: np.ndarray, commits: List[asyncio.Task]):
+        try:
+            # Shielded: cancelling a stale partial must not cancel the committed transcripts
+            committed = [await asyncio.shield(task) for task in commits]
+            text = " ".join(part for part in committed + [await _transcribe(window)] if part)
+            if self.active and text:
+                metrics.incr("voice_stream_partials_total")
+                await self.send({"type": "partial", "text": text})
+        except Exception as e:
+            logger.warning(f"Partial transcription failed: {str(e)}")
+        finally:
+            if self._partial is asyncio.current_task():
+                self._partial = None
+
+    def end_utterance(self) -> bool:
+        """Finish the current utterance (end-of-speech, or the client said it stopped talking)"""
+        if not self.active:
+            return False
+        audio, window_start, commits = self._utterance(), self._window_start, self._commits
+        self.active = False
+        self._audio, self._samples, self._window_start, self._commits = [], 0, 0, []
+        if self._partial is not None:
+            self._partial.cancel()
+            self._partial = None
+        self.endpointer.reset()
+        self._spawn(self._finish(audio[window_start:], commits))
+        return True
+
+    async def _finish(self, tail: np.ndarray, commits: List[asyncio.Task]):
+        ended = time.perf_counter()
+        async with self._turn_lock:
+            try:
+                parts = [await task for task in commits] + [await _transcribe(tail)]
+                text = " ".join(part for part in parts if part)
+                if not text:
+                    return
+                # Time from end-of-speech to the final transcript
+                metrics.incr("voice_stream_utterances_total")
+                metrics.incr("voice_stream_final_seconds_total", time.perf_counter() - ended)
+                await self.send({"type": "final", "text": text})
+                reply = await self.on_utterance(text)
+                if reply is not None:
+                    await self.send({"type": "reply", "text": reply})
+            except Exception as e:
+                logger.error(f"Voice stream utterance failed: {str(e)}")
+                await self.send({"type": "error", "detail": str(e)})
+
+    async def close(self):
+        """Stop all work for a session whose client went away"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
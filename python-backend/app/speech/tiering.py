@@ -0,0 +1,62 @@
+import os
+from typing import List, Optional
+
+from ..metrics import metrics
+from .whisper_registry import NO_SPEECH_PROB
+
+# Pool load (clips waiting or running / queue size) at which the smallest tier is used;
+# an idle pool gets the largest
+WHISPER_TIER_SATURATION = float(os.getenv("WHISPER_TIER_SATURATION", "0.5"))
+# Clips with more speech than this go one tier down; they cost the most per request
+WHISPER_TIER_LONG_CLIP_SECONDS = float(os.getenv("WHISPER_TIER_LONG_CLIP_SECONDS", "20"))
+# Segments whose average token log-probability is below this are re-run on the next tier up
+WHISPER_RERUN_LOGPROB = float(os.getenv("WHISPER_RERUN_LOGPROB", "-1.0"))
+# ...but only while the pool load is at most this
+WHISPER_RERUN_MAX_LOAD = float(os.getenv("WHISPER_RERUN_MAX_LOAD", "0.25"))
+
+
+def choose_tier(clip_seconds: float, load: float, sizes: List[str]) -> str:
+    """Pick a model size (sizes are smallest first) for a clip given how busy the pool is"""
+    if len(sizes) == 1:
+        size = sizes[0]
+    else:
+        busy = min(1.0, load / WHISPER_TIER_SATURATION) if WHISPER_TIER_SATURATION > 0 else 1.0
+        index = round((1 - busy) * (len(sizes) - 1))
+        if clip_seconds > WHISPER_TIER_LONG_CLIP_SECONDS:
+            index -= 1
+        size = sizes[max(0, index)]
+    metrics.incr(f"whisper_tier_{size}_total")
+    return size
+
+
+def confidence(result: dict) -> Optional[float]:
+    """Average token log-probability of a transcription result, if the model reported one"""
+    if result.get("avg_logprob") is not None:
+        return result["avg_logprob"]
+    segments = [s for s in result.get("segments") or [] if s.get("avg_logprob") is not None]
+    if not segments:
+        return None
+    return sum(s["avg_logprob"] for s in segments) / len(segments)
+
+
+def rerun_tier(result: dict, size: str, sizes: List[str], load: float) -> Optional[str]:
+    """The larger size to re-run a low-confidence result on, or None"""
+    score = confidence(result)
+    if score is None or score >= WHISPER_RERUN_LOGPROB or size not in sizes or size == sizes[-1]:
+        return None
+    # Silence is not worth a re-run
+    if (result.get("no_speech_prob") or 0.0) >= NO_SPEECH_PROB:
+        return None
+    metrics.incr("whisper_rerun_candidates_total")
+    if load > WHISPER_RERUN_MAX_LOAD:
+        # No spare capacity; keep the small model's answer rather than slow everyone down
+        metrics.incr("whisper_reruns_skipped_total")
+        return None
+    return sizes[sizes.index(size) + 1]
+
+
+def record_reruns(segments: int, reruns: int):
+    metrics.incr("whisper_tiered_segments_total", segments)
+    metrics.incr("whisper_reruns_total", reruns)
+    total = metrics.get("whisper_tiered_segments_total")
+    metrics.set_gauge("whisper_rerun_rate", metrics.get("whisper_reruns_total") / total if total else 0.0)
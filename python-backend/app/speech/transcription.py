@@ -0,0 +1,102 @@
+import asyncio
+import logging
+from dataclasses import dataclass, asdict
+from concurrent.futures import Future
+from typing import List, Optional, Tuple
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+from ..tracing import record, span
+from . import whisper_registry
+from .transcription_cache import transcription_cache
+from .audio import SAMPLE_RATE
+from .tiering import choose_tier, confidence, rerun_tier, record_reruns
+from .transcription_pool import TranscriptionPool, TranscriptionQueueFull, get_transcription_pool
+from .vad import preprocess
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Transcript:
+    text: str
+    audio_seconds: float
+    audio_seconds_saved: float
+
+
+def _submit_all(pool: TranscriptionPool, jobs: List[Tuple[np.ndarray, str]], language: Optional[str]) -> List[Future]:
+    """Submit every job or none: if the queue fills up partway, the ones already queued are cancelled"""
+    futures = []
+    try:
+        for segment, size in jobs:
+            futures.append(pool.submit(segment, language, size))
+    except TranscriptionQueueFull:
+        for future in futures:
+            future.cancel()
+        raise
+    return futures
+
+
+async def transcribe_segments(segments: List[np.ndarray], language: Optional[str] = None) -> List[str]:
+    """
+    Transcribe speech segments on the pool with the model tier suited to the current
+    load and the clip length, then re-run low-confidence segments one tier up while
+    the pool has spare capacity. With a single tier this is one batched pass.
+    """
+    pool = get_transcription_pool()
+    sizes = whisper_registry.tiers()
+    size = choose_tier(sum(len(segment) for segment in segments) / SAMPLE_RATE, pool.load, sizes)
+    # Submitted before the first await so concurrent requests see each other in the pool load
+    futures = _submit_all(pool, [(segment, size) for segment in segments], language)
+    results = list(await asyncio.gather(*(asyncio.wrap_future(future) for future in futures)))
+    reruns = [(i, larger) for i, larger in
+              ((i, rerun_tier(result, size, sizes, pool.load)) for i, result in enumerate(results)) if larger]
+    if reruns:
+        try:
+            futures = _submit_all(pool, [(segments[i], larger) for i, larger in reruns], language)
+        except TranscriptionQueueFull:
+            # The first pass already answered; a full queue only costs the re-runs
+            logger.info(f"Skipped {len(reruns)} re-run(s): transcription queue is full")
+            reruns = []
+    if reruns:
+        retried = await asyncio.gather(*(asyncio.wrap_future(future) for future in futures))
+        for (i, larger), result in zip(reruns, retried):
+            score, previous = confidence(result), confidence(results[i])
+            # 0.0 is a perfectly confident score, so only a missing one loses
+            if score is not None and (previous is None or score > previous):
+                results[i] = result
+        logger.info(f"Re-ran {len(reruns)} low-confidence segment(s) above the '{size}' tier")
+    record_reruns(len(segments), len(reruns))
+    # Segments run side by side, so the slowest one is the request's wait for each stage
+    for stage in ("queue", "load", "inference"):
+        seconds = max((result["timings"].get(stage, 0.0) for result in results if "timings" in result), default=0.0)
+        if seconds:
+            record(f"whisper_{stage}", seconds)
+    return [result["text"].strip() for result in results]
+
+
+async def transcribe_clip(audio: np.ndarray, language: Optional[str] = None) -> Transcript:
+    """
+    Transcribe a decoded upload: silence is trimmed and long recordings split into
+    speech segments first (NoSpeechDetected for empty clips), then the segments are
+    transcribed together on the pool, which batches them, and the texts joined.
+    Identical audio is answered from the transcription cache without running either.
+    """
+    # Every tier can produce the entry, so the resident set of sizes is part of the key
+    models = ",".join(whisper_registry.tiers())
+    with span("transcription_cache"):
+        key = await run_in_threadpool(transcription_cache.make_key, audio, models, language)
+        cached = await run_in_threadpool(transcription_cache.get, key)
+    if cached is not None:
+        logger.info("Transcription cache hit")
+        return Transcript(**cached)
+    with span("vad"):
+        vad = await run_in_threadpool(preprocess, audio)
+    with span("whisper"):
+        texts = await transcribe_segments(vad.segments, language)
+    logger.info(f"Transcribed {vad.speech_seconds:.1f}s of speech from a {vad.total_seconds:.1f}s clip "
+                f"in {len(vad.segments)} segment(s)")
+    transcript = Transcript(" ".join(text for text in texts if text), vad.total_seconds, vad.saved_seconds)
+    await run_in_threadpool(transcription_cache.put, key, asdict(transcript))
+    return transcript
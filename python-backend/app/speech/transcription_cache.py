@@ -0,0 +1,125 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+from ..metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TranscriptionCache:
+    """
+    Content-addressed cache of transcripts: the key is a hash of the decoded PCM plus
+    the model size and language, so re-uploads of the same recording (frontend retries,
+    test clips) skip VAD and Whisper whatever container they arrive in. A bounded LRU
+    in memory, backed by one JSON file per entry under `directory` when it is set.
+    """
+
+    def __init__(self, max_entries: int = 256, directory: Optional[str] = None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(audio: np.ndarray, model_size: str, language: Optional[str] = None) -> str:
+        digest = hashlib.sha256(np.ascontiguousarray(audio, dtype=np.float32).tobytes()).hexdigest()
+        return f"{digest}-{model_size}-{language or 'auto'}"
+
+    def _path(self, key: str) -> str:
+        # Two-level fan-out keeps directories small
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _read_disk(self, key: str) -> Optional[dict]:
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable transcription cache entry {key}: {str(e)}")
+            return None
+
+    def _write_disk(self, key: str, value: dict):
+        if not self.directory:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(value, f)
+            # Atomic, so concurrent workers never read half an entry
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write transcription cache entry {key}: {str(e)}")
+
+    def _remember(self, key: str, value: dict):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            metrics.set_gauge("whisper_cache_entries", len(self._entries))
+
+    def get(self, key: str) -> Optional[dict]:
+        """Look the key up in memory, then on disk; blocking, so call it off the event loop"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+        tier = "memory"
+        if value is None:
+            value = self._read_disk(key)
+            tier = "disk"
+            if value is not None:
+                self._remember(key, value)
+        with self._lock:
+            if value is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+            hit_rate = self.hits / (self.hits + self.misses)
+        if value is not None:
+            metrics.incr(f"whisper_cache_{tier}_hits_total")
+        else:
+            metrics.incr("whisper_cache_misses_total")
+        metrics.set_gauge("whisper_cache_hit_rate", hit_rate)
+        return value
+
+    def put(self, key: str, value: dict):
+        self._remember(key, value)
+        self._write_disk(key, value)
+
+    def clear(self):
+        """Drop the in-memory tier; disk entries stay for the next process"""
+        with self._lock:
+            self._entries.clear()
+        metrics.set_gauge("whisper_cache_entries", 0)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "directory": self.directory,
+            }
+
+
+transcription_cache = TranscriptionCache(
+    max_entries=int(os.getenv("TRANSCRIPTION_CACHE_SIZE", "256")),
+    directory=os.getenv("TRANSCRIPTION_CACHE_DIR") or None,
+)
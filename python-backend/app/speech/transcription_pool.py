@@ -0,0 +1,223 @@
+import asyncio
+import copy
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ..metrics import metrics
+from . import whisper_registry
+from .audio import SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# Whisper's encoder always sees 30 s of audio; longer clips go through model.transcribe
+_MAX_BATCH_SECONDS = 30
+
+
+class TranscriptionQueueFull(Exception):
+    """Raised when too many clips are waiting for a transcription worker"""
+
+    def __init__(self, queue_depth: int):
+        self.queue_depth = queue_depth
+        super().__init__(f"Voice transcription is busy ({queue_depth} clips waiting). Please try again shortly.")
+
+
+class _Request:
+    def __init__(self, audio: np.ndarray, language: Optional[str], size: Optional[str]):
+        self.audio = audio
+        self.language = language
+        self.size = size or whisper_registry.WHISPER_MODEL_SIZE
+        self.future: Future = Future()
+        self.enqueued_at = time.perf_counter()
+        # Seconds spent queued, loading the model and in inference, for request tracing
+        self.timings: Dict[str, float] = {}
+
+    def resolve(self, result: dict):
+        self.future.set_result({**result, "timings": self.timings})
+
+
+class TranscriptionPool:
+    """
+    Worker threads that collect queued clips for up to `window` seconds (or until
+    `batch_size` are waiting) and transcribe them in batched Whisper passes, one per
+    model size. Each worker owns its model instances, so workers run in parallel;
+    torch releases the GIL during inference, so the event loop is never blocked.
+    """
+
+    def __init__(self, workers: int = 1, batch_size: int = 8, window: float = 0.02, max_queue: int = 16):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.window = window
+        self.max_queue = max_queue
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._running = 0
+        self._threads = []
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, args=(i,), name=f"whisper-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            logger.info(f"Started {self.workers} Whisper worker(s), batches of up to {self.batch_size}, "
+                        f"queue size {self.max_queue}")
+
+    @property
+    def queue_depth(self) -> int:
+        return self._waiting
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    def _update_gauges(self):
+        metrics.set_gauge("whisper_queue_depth", self._waiting)
+        metrics.set_gauge("whisper_running", self._running)
+
+    @property
+    def load(self) -> float:
+        """Clips waiting or running, as a fraction of the queue size"""
+        return (self._waiting + self._running) / max(1, self.max_queue)
+
+    def submit(self, audio: np.ndarray, language: Optional[str] = None, size: Optional[str] = None) -> Future:
+        self._ensure_started()
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                metrics.incr("whisper_requests_rejected_total")
+                raise TranscriptionQueueFull(self._waiting)
+            self._waiting += 1
+            self._update_gauges()
+        request = _Request(audio, language, size)
+        self._queue.put(request)
+        return request.future
+
+    async def transcribe(self, audio: np.ndarray, language: Optional[str] = None, size: Optional[str] = None) -> dict:
+        """Queue one clip for the model of this size and await its result dict (at least a "text" key)"""
+        return await asyncio.wrap_future(self.submit(audio, language, size))
+
+    def _collect(self, first: _Request) -> List[_Request]:
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                # Shutting down; let another worker (or the next loop) see the sentinel
+                self._queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _model(self, index: int, size: str, models: Dict[str, object]):
+        if size not in models:
+            model = whisper_registry.get_whisper_model(size)
+            # Worker 0 uses the shared models; the others get private copies to run concurrently
+            models[size] = model if index == 0 else copy.deepcopy(model)
+        return models[size]
+
+    def _worker(self, index: int):
+        models: Dict[str, object] = {}
+        locks: Dict[str, threading.Lock] = {}
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = self._collect(first)
+            with self._lock:
+                self._waiting -= len(batch)
+                self._running += len(batch)
+                self._update_gauges()
+            now = time.perf_counter()
+            for request in batch:
+                request.timings["queue"] = now - request.enqueued_at
+            metrics.incr("whisper_queue_wait_seconds_total", sum(r.timings["queue"] for r in batch))
+            try:
+                self._run(index, models, locks, [r for r in batch if r.future.set_running_or_notify_cancel()])
+            except Exception as e:
+                logger.error(f"Whisper batch failed: {str(e)}")
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._running -= len(batch)
+                    self._update_gauges()
+
+    def _run(self, index: int, models: Dict[str, object], locks: Dict[str, threading.Lock], batch: List[_Request]):
+        groups = {}
+        for request in batch:
+            started = time.perf_counter()
+            model = self._model(index, request.size, models)
+            loaded = time.perf_counter() - started
+            if loaded > 0.001:
+                request.timings["load"] = loaded
+            lock = locks.setdefault(request.size, whisper_registry.inference_lock(request.size)
+                                    if index == 0 else threading.Lock())
+            batchable = hasattr(model, "decode") and hasattr(model, "dims")
+            if batchable and len(request.audio) <= _MAX_BATCH_SECONDS * SAMPLE_RATE:
+                groups.setdefault((request.size, request.language), []).append(request)
+            else:
+                with lock:
+                    started = time.perf_counter()
+                    result = model.transcribe(request.audio, language=request.language)
+                    request.timings["inference"] = time.perf_counter() - started
+                metrics.incr("whisper_inference_total")
+                metrics.incr("whisper_inference_seconds_total", request.timings["inference"])
+                request.resolve(result)
+        for (size, language), requests in groups.items():
+            model, lock = models[size], locks[size]
+            with lock:
+                started = time.perf_counter()
+                results = whisper_registry.transcribe_batch(model, [r.audio for r in requests], language)
+                elapsed = time.perf_counter() - started
+            for request, result in zip(requests, results):
+                request.timings["inference"] = elapsed
+                request.resolve(result)
+
+    def shutdown(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        self._threads = []
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_transcription_pool() -> TranscriptionPool:
+    """Return the process-wide transcription pool"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = TranscriptionPool(
+                    workers=int(os.getenv("WHISPER_WORKERS", "1")),
+                    batch_size=int(os.getenv("WHISPER_BATCH_SIZE", "8")),
+                    window=float(os.getenv("WHISPER_BATCH_WINDOW_MS", "20")) / 1000,
+                    max_queue=int(os.getenv("WHISPER_QUEUE_SIZE", "16")),
+                )
+    return _pool
+
+
+def set_transcription_pool(pool: TranscriptionPool):
+    """Replace the process-wide pool (used by benchmarks to size it)"""
+    global _pool
+    with _pool_lock:
+        _pool = pool
@@ -0,0 +1,174 @@
+import os
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from ..metrics import metrics
+from .audio import SAMPLE_RATE
+
+# Energy-based voice activity detection on 30 ms frames of 16 kHz audio
+VAD_FRAME_MS = 30
+FRAME_SAMPLES = SAMPLE_RATE * VAD_FRAME_MS // 1000
+# Frames louder than this (dBFS) count as speech; quieter rooms lower the bar down to it
+VAD_THRESHOLD_DB = float(os.getenv("VAD_THRESHOLD_DB", "-40"))
+# Speech must also be this far above the estimated noise floor
+VAD_MARGIN_DB = float(os.getenv("VAD_MARGIN_DB", "10"))
+_SILENCE_DB = -100.0
+
+
+def frame_levels(audio: np.ndarray) -> np.ndarray:
+    """RMS level of each whole frame in dBFS"""
+    count = len(audio) // FRAME_SAMPLES
+    if not count:
+        return np.zeros(0, dtype=np.float32)
+    frames = audio[:count * FRAME_SAMPLES].reshape(count, FRAME_SAMPLES).astype(np.float64)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    return np.maximum(20 * np.log10(np.maximum(rms, 1e-10)), _SILENCE_DB).astype(np.float32)
+
+
+class Endpointer:
+    """
+    Streaming start/end-of-speech detector. Tracks the noise floor as a slow-moving
+    minimum of frame levels, marks speech after `start_ms` of loud frames and the end
+    of it after `end_ms` of quiet ones.
+    """
+
+    def __init__(self, start_ms: int = 90, end_ms: int = 700):
+        self.start_frames = max(1, start_ms // VAD_FRAME_MS)
+        self.end_frames = max(1, end_ms // VAD_FRAME_MS)
+        # Start just under the fixed threshold so speech from the first frame is caught
+        self.noise_floor = VAD_THRESHOLD_DB - VAD_MARGIN_DB
+        self.in_speech = False
+        self._run = 0
+        self._remainder = np.zeros(0, dtype=np.float32)
+
+    def threshold(self) -> float:
+        return max(VAD_THRESHOLD_DB, self.noise_floor + VAD_MARGIN_DB)
+
+    def _update_floor(self, level: float):
+        if level < self.noise_floor:
+            self.noise_floor = level
+        else:
+            # Rise slowly (~15 s time constant) so steady background noise is learned but speech is not
+            self.noise_floor += 0.002 * (level - self.noise_floor)
+
+    def feed(self, audio: np.ndarray) -> Optional[str]:
+        """Consume samples; return "start" or "end" when speech begins or ends in them"""
+        audio = np.concatenate([self._remainder, audio]) if len(self._remainder) else audio
+        levels = frame_levels(audio)
+        self._remainder = audio[len(levels) * FRAME_SAMPLES:]
+        event = None
+        for level in levels:
+            loud = level >= self.threshold()
+            self._update_floor(float(level))
+            if loud != self.in_speech:
+                self._run += 1
+                needed = self.end_frames if self.in_speech else self.start_frames
+                if self._run >= needed:
+                    self.in_speech = loud
+                    self._run = 0
+                    event = "start" if loud else "end"
+            else:
+                self._run = 0
+        return event
+
+    def reset(self):
+        """Forget the current utterance but keep the noise floor estimate"""
+        self.in_speech = False
+        self._run = 0
+
+
+# Offline preprocessing of whole clips before transcription
+VAD_ENABLED = os.getenv("VAD_ENABLED", "true").lower() in ("1", "true", "yes")
+# Pauses shorter than this stay inside a segment
+VAD_MIN_SILENCE_MS = int(os.getenv("VAD_MIN_SILENCE_MS", "600"))
+# Bursts shorter than this (clicks, breaths) are not speech
+VAD_MIN_SPEECH_MS = int(os.getenv("VAD_MIN_SPEECH_MS", "200"))
+# Audio kept around each segment so word onsets and endings are not clipped
+VAD_PADDING_MS = int(os.getenv("VAD_PADDING_MS", "200"))
+# Whisper decodes 30 s windows; longer segments are split at their quietest point
+VAD_MAX_SEGMENT_SECONDS = float(os.getenv("VAD_MAX_SEGMENT_SECONDS", "30"))
+
+
+class NoSpeechDetected(ValueError):
+    """The clip is silence or noise; there is nothing to transcribe"""
+
+
+@dataclass
+class VadResult:
+    segments: List[np.ndarray]
+    total_seconds: float
+    speech_seconds: float
+
+    @property
+    def saved_seconds(self) -> float:
+        return max(0.0, self.total_seconds - self.speech_seconds)
+
+
+def _speech_runs(levels: np.ndarray) -> List[Tuple[int, int]]:
+    """Frame ranges of speech: loud frames, joined across short pauses, without short bursts"""
+    # The quietest tenth of the clip approximates its noise floor. Speech must stand a fixed
+    # margin above it, so steady noise (fans, mic hiss) never counts however loud it is; even
+    # continuous speech dips between syllables, so its floor still sits below the vowels
+    floor = np.percentile(levels, 10)
+    loud = levels >= max(VAD_THRESHOLD_DB, floor + VAD_MARGIN_DB)
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], loud.astype(np.int8), [0]))))
+    runs = list(zip(edges[::2].tolist(), edges[1::2].tolist()))
+    gap = VAD_MIN_SILENCE_MS // VAD_FRAME_MS
+    merged: List[Tuple[int, int]] = []
+    for start, end in runs:
+        if merged and start - merged[-1][1] < gap:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    shortest = VAD_MIN_SPEECH_MS // VAD_FRAME_MS
+    return [(start, end) for start, end in merged if end - start >= shortest]
+
+
+def _split(start: int, end: int, levels: np.ndarray, limit: int) -> List[Tuple[int, int]]:
+    """Split a frame range into pieces of at most `limit` frames at the quietest frames"""
+    pieces = []
+    while end - start > limit:
+        # Cut in the last quarter of the allowed length, where it is quietest
+        search = start + limit * 3 // 4
+        cut = search + int(np.argmin(levels[search:start + limit]))
+        pieces.append((start, cut))
+        start = cut
+    pieces.append((start, end))
+    return pieces
+
+
+def detect_speech(audio: np.ndarray) -> List[Tuple[int, int]]:
+    """Sample ranges of speech in a 16 kHz clip, padded and at most VAD_MAX_SEGMENT_SECONDS long"""
+    levels = frame_levels(audio)
+    if not len(levels):
+        return []
+    padding = VAD_PADDING_MS // VAD_FRAME_MS
+    limit = max(4, int(VAD_MAX_SEGMENT_SECONDS * 1000) // VAD_FRAME_MS)
+    ranges = []
+    for start, end in _speech_runs(levels):
+        # Pad the outer edges only; pieces of one run meet at their cut
+        start, end = max(0, start - padding), min(len(levels), end + padding)
+        for piece_start, piece_end in _split(start, end, levels, limit):
+            ranges.append((piece_start * FRAME_SAMPLES, piece_end * FRAME_SAMPLES))
+    return ranges
+
+
+def preprocess(audio: np.ndarray) -> VadResult:
+    """
+    Trim silence from a clip and split it into speech segments for Whisper. Raises
+    NoSpeechDetected for clips without speech so they never reach the model.
+    """
+    total = len(audio) / SAMPLE_RATE
+    if not VAD_ENABLED:
+        return VadResult([audio] if len(audio) else [], total, total)
+    segments = [audio[start:end] for start, end in detect_speech(audio)]
+    speech = sum(len(segment) for segment in segments) / SAMPLE_RATE
+    metrics.incr("vad_audio_seconds_total", total)
+    if not segments:
+        metrics.incr("vad_empty_clips_total")
+        raise NoSpeechDetected("No speech detected in the recording")
+    metrics.incr("vad_audio_seconds_saved_total", total - speech)
+    metrics.incr("vad_segments_total", len(segments))
+    return VadResult(segments, total, speech)
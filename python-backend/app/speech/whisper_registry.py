@@ -0,0 +1,115 @@
+import os
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+from ..metrics import metrics
+
+# One of tiny, base, small, medium, large (or any name whisper.load_model accepts)
+WHISPER_MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "base")
+# Sizes kept resident for adaptive tiering, smallest first, e.g. "tiny,base,small";
+# unset means WHISPER_MODEL_SIZE only
+WHISPER_TIERS = [size.strip() for size in os.getenv("WHISPER_TIERS", "").split(",") if size.strip()] \
+    or [WHISPER_MODEL_SIZE]
+
+# Whisper's own threshold for "this segment is silence"; model.transcribe drops such segments
+NO_SPEECH_PROB = 0.6
+
+# Process-wide Whisper models, by size, shared by every voice route
+_models: Dict[str, object] = {}
+_lock = threading.Lock()
+# A torch model is not safe to run from several threads at once; hold its lock around inference
+_inference_locks: Dict[str, threading.Lock] = {}
+
+
+def _load_model(size: str):
+    import whisper
+    logger.info(f"Loading Whisper model '{size}'")
+    started = time.perf_counter()
+    model = whisper.load_model(size)
+    elapsed = time.perf_counter() - started
+    metrics.set_gauge(f"whisper_model_{size}_load_seconds", elapsed)
+    if size == WHISPER_MODEL_SIZE:
+        metrics.set_gauge("whisper_model_load_seconds", elapsed)
+    logger.info(f"Whisper model '{size}' loaded in {elapsed:.2f}s")
+    return model
+
+
+def get_whisper_model(size: Optional[str] = None):
+    """Return the shared Whisper model of this size (default WHISPER_MODEL_SIZE), loading it on first use"""
+    size = size or WHISPER_MODEL_SIZE
+    model = _models.get(size)
+    if model is None:
+        with _lock:
+            model = _models.get(size)
+            if model is None:
+                model = _models[size] = _load_model(size)
+    return model
+
+
+def set_whisper_model(model, size: Optional[str] = None):
+    """Replace a shared model (used by tests and benchmarks to inject a stand-in)"""
+    with _lock:
+        _models[size or WHISPER_MODEL_SIZE] = model
+
+
+def inference_lock(size: Optional[str] = None) -> threading.Lock:
+    size = size or WHISPER_MODEL_SIZE
+    with _lock:
+        return _inference_locks.setdefault(size, threading.Lock())
+
+
+def tiers() -> List[str]:
+    return WHISPER_TIERS
+
+
+def is_loaded() -> bool:
+    return WHISPER_MODEL_SIZE in _models
+
+
+def transcribe_batch(model, audios: List[np.ndarray], language: Optional[str] = None) -> List[dict]:
+    """
+    Decode several clips of at most 30 s in one batched encoder/decoder pass on
+    padded log-mel spectrograms. Clips Whisper judges silent come back with empty
+    text, as model.transcribe returns them. The caller owns `model`; it is not locked here.
+    """
+    import torch
+    import whisper
+    started = time.perf_counter()
+    mels = torch.stack([
+        whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.from_numpy(audio)), model.dims.n_mels)
+        for audio in audios
+    ]).to(model.device)
+    options = whisper.DecodingOptions(language=language, without_timestamps=True,
+                                      fp16=model.device.type == "cuda")
+    with torch.no_grad():
+        results = model.decode(mels, options)
+    elapsed = time.perf_counter() - started
+    metrics.incr("whisper_inference_total", len(audios))
+    metrics.incr("whisper_inference_seconds_total", elapsed)
+    metrics.incr("whisper_batches_total")
+    metrics.set_gauge("whisper_last_inference_seconds", elapsed)
+    metrics.set_gauge("whisper_last_batch_size", len(audios))
+    silent = sum(r.no_speech_prob >= NO_SPEECH_PROB for r in results)
+    if silent:
+        metrics.incr("whisper_no_speech_total", silent)
+    return [{"text": "" if r.no_speech_prob >= NO_SPEECH_PROB else r.text, "language": r.language,
+             "avg_logprob": r.avg_logprob, "no_speech_prob": r.no_speech_prob} for r in results]
+
+
+def preload():
+    """Load the model (every tier, with WHISPER_TIERS) at startup when PRELOAD_WHISPER_MODEL is enabled"""
+    if os.getenv("PRELOAD_WHISPER_MODEL", "false").lower() not in ("1", "true", "yes"):
+        return
+    try:
+        for size in WHISPER_TIERS:
+            get_whisper_model(size)
+    except Exception as e:
+        # Text chat keeps working without the speech model
+        logger.error(f"Could not preload Whisper model: {str(e)}")
@@ -0,0 +1,107 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+
+from .metrics import metrics
+
+# Add a Server-Timing header with the request's span timings to every response
+TRACE_SERVER_TIMING = os.getenv("TRACE_SERVER_TIMING", "false").lower() in ("1", "true", "yes")
+
+
+class Trace:
+    """Span timings of one request. Repeated spans (e.g. DB queries) accumulate"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: Dict[str, Tuple[float, int]] = {}
+
+    def add(self, name: str, seconds: float):
+        total, count = self.spans.get(name, (0.0, 0))
+        self.spans[name] = (total + seconds, count + 1)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        entries = [f"{name};dur={total * 1000:.1f}" + (f';desc="{count}x"' if count > 1 else "")
+                   for name, (total, count) in self.spans.items()]
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def record(name: str, seconds: float):
+    """Add a finished span to the current request's trace and to the span_<name>_seconds histogram"""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, seconds)
+    metrics.observe(f"span_{name}_seconds", seconds)
+
+
+@contextmanager
+def span(name: str):
+    """Time the enclosed block as a span; works in sync and async code alike"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("trace_query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("trace_query_started")
+    if started:
+        record("db", time.perf_counter() - started.pop())
+
+
+def instrument_engine(engine):
+    """Time every SQL statement on this engine as a "db" span"""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware that gives every HTTP request a Trace, records its duration in the
+    http_request_seconds histogram and, with TRACE_SERVER_TIMING, adds a Server-Timing
+    header. Streaming responses send headers first, so theirs cover setup only.
+    """
+
+    def __init__(self, app, server_timing: bool = TRACE_SERVER_TIMING):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trace = Trace()
+        token = _current.set(trace)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and self.server_timing:
+                headers: List = list(message.get("headers", []))
+                headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            metrics.observe("http_request_seconds", trace.elapsed())
+            _current.reset(token)
@@ -0,0 +1,189 @@
+"""
+End-to-end agent benchmark on SQLite with stand-in model backends.
+
+Drives AppointmentAgent.process_message over a corpus of realistic utterances for a
+seeded clinic, using FakeLlama (and FakeWhisper with --voice) with configurable
+latency, and reports per-intent p50/p95 latency, DB queries per message and the
+LLM-fallback rate. With --voice each utterance is first a synthetic clip sent through
+the app's voice path (transcription cache, VAD, transcription pool) to FakeWhisper,
+registered as the Whisper model. With --max-p95-ms it exits 1 when a routed (non-LLM) intent is
+slower than the budget, so routing regressions fail before deploying.
+
+    python -m benchmarks.bench_agent --rounds 20
+    python -m benchmarks.bench_agent --voice --whisper-latency 0.5 --llm-latency 0.2
+"""
+import argparse
+import asyncio
+import sys
+import time
+import logging
+from collections import defaultdict
+from datetime import date, timedelta
+
+import numpy as np
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models import Base, User, UserRole, Doctor, Appointment
+from app.agent import model_registry
+from app.agent.appointment_agent import AppointmentAgent
+from app.agent.doctor_index import doctor_index
+from app.agent.response_cache import response_cache
+from app.agent.slot_extraction import frame_cache
+from app.agent.inference_scheduler import get_scheduler
+from app.speech import whisper_registry
+from app.speech.audio import SAMPLE_RATE
+from app.speech.transcription import transcribe_clip
+from benchmarks.fakes import FakeLlama, FakeWhisper
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+# The agent logs every message; keep the report readable
+logging.getLogger("app").setLevel(logging.WARNING)
+
+DOCTORS = [("John", "Smith", "Cardiology"), ("Priya", "Patel", "Dermatology"),
+           ("Arjun", "Rao", "Orthopedics"), ("Maria", "Garcia", "Pediatrics")]
+
+# {date} is a per-round future date so bookings do not all collide; {apt_id} is the
+# patient's latest appointment
+CORPUS = [
+    "hi, what can you help me with?",
+    "Book an appointment with Dr. John Smith on {date} at 3pm for a checkup",
+    "I want to book with Dr Patel on {date} at 10 am for a rash",
+    "show my upcoming appointments",
+    "what are my pending appointments",
+    "change appointment {apt_id} to {date} 4:30 pm",
+    "reschedule my appointment with Dr. Patel to {date} 11:00",
+    "list doctors",
+    "do you have parking at the clinic?",
+    "cancel my appointment with dr john smith on {date}",
+    "make an appointment with Dr. Rao on {date} at 9 for knee pain",
+    "delete my appointment with dr rao on {date}",
+    "my appointments",
+    "can I bring my child to the appointment?",
+]
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+def synthetic_clip(seed: int, seconds: float) -> np.ndarray:
+    """Silence, `seconds` of speech-like bursts, silence; each seed gives a new recording, so the transcription cache misses"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    # 4 Hz syllable-rate envelope over a voiced tone plus noise
+    speech = (0.5 + 0.5 * np.sin(2 * np.pi * 4 * t)) * (0.2 * np.sin(2 * np.pi * 180 * t) + 0.05 * rng.standard_normal(len(t)))
+    pad = np.zeros(int(0.5 * SAMPLE_RATE))
+    return np.concatenate([pad, speech, pad, pad]).astype(np.float32)
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def seed(db):
+    for i, (first, last, specialization) in enumerate(DOCTORS):
+        user = User(email=f"doctor{i}@example.com", password="x", first_name=first, last_name=last,
+                    role=UserRole.DOCTOR)
+        db.add(user)
+        db.flush()
+        db.add(Doctor(user_id=user.id, specialization=specialization, license_number=f"LIC{i}"))
+    patient = User(email="patient@example.com", password="x", first_name="Jane", last_name="Doe")
+    db.add(patient)
+    db.commit()
+    return patient.id
+
+
+async def run(args) -> int:
+    llm = FakeLlama(prompt_latency=args.llm_latency, token_latency=args.token_latency)
+    model_registry.set_llm(llm)
+    whisper_model = FakeWhisper(latency=args.whisper_latency)
+    if args.voice:
+        # Registered like a loaded checkpoint, so clips go through the pool to it
+        for size in whisper_registry.tiers():
+            whisper_registry.set_whisper_model(whisper_model, size)
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    patient_id = seed(db)
+    counter = QueryCounter(engine)
+    doctor_index.load(db)
+
+    latencies = defaultdict(list)
+    queries = defaultdict(list)
+    transcription = []
+    for round_number in range(args.rounds):
+        day = (date.today() + timedelta(days=30 + round_number)).isoformat()
+        for template in CORPUS:
+            latest = db.query(Appointment.id).filter(Appointment.user_id == patient_id).order_by(
+                Appointment.id.desc()).first()
+            message = template.format(date=day, apt_id=latest[0] if latest else 1)
+            if not args.llm_cache:
+                response_cache.clear()
+                frame_cache.clear()
+            counter.count = 0
+            started = time.perf_counter()
+            if args.voice:
+                clip = synthetic_clip(len(transcription), args.clip_seconds)
+                # The fake "recognizes" the utterance the clip stands for
+                whisper_model.text = message
+                transcribed_at = time.perf_counter()
+                message = (await transcribe_clip(clip)).text
+                transcription.append(time.perf_counter() - transcribed_at)
+            agent = AppointmentAgent(db)
+            await agent.process_message(message, patient_id)
+            latencies[agent.last_intent].append(time.perf_counter() - started)
+            queries[agent.last_intent].append(counter.count)
+
+    total = sum(len(v) for v in latencies.values())
+    fallbacks = len(latencies.get("fallback", []))
+    logger.info(f"{total} messages over {args.rounds} rounds; LLM latency {args.llm_latency * 1e3:.0f} ms"
+                f" + {args.token_latency * 1e3:.0f} ms/token" + (f"; Whisper {args.whisper_latency * 1e3:.0f} ms"
+                                                                 if args.voice else ""))
+    logger.info(f"{'intent':<26}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}{'queries':>9}")
+    slow = []
+    for intent in sorted(latencies):
+        values = latencies[intent]
+        p50, p95 = percentile(values, 50) * 1e3, percentile(values, 95) * 1e3
+        mean_queries = sum(queries[intent]) / len(queries[intent])
+        logger.info(f"{intent:<26}{len(values):>5}{p50:>10.2f}{p95:>10.2f}{mean_queries:>9.1f}")
+        if args.max_p95_ms is not None and intent != "fallback" and p95 > args.max_p95_ms:
+            slow.append(intent)
+    logger.info(f"LLM fallback rate: {fallbacks / total:.1%} ({llm.calls} model calls)")
+    if transcription:
+        logger.info(f"Transcription p50/p95: {percentile(transcription, 50) * 1e3:.2f}/"
+                    f"{percentile(transcription, 95) * 1e3:.2f} ms")
+    get_scheduler().shutdown()
+    if slow:
+        logger.error(f"p95 over {args.max_p95_ms} ms budget: {', '.join(slow)}")
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds of prompt processing per call")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="seconds per generated token")
+    parser.add_argument("--voice", action="store_true", help="transcribe each utterance with FakeWhisper first")
+    parser.add_argument("--whisper-latency", type=float, default=0.3)
+    parser.add_argument("--clip-seconds", type=float, default=2.0, help="speech length of each synthetic voice clip")
+    parser.add_argument("--llm-cache", action="store_true", help="keep the LLM reply and extraction caches between messages")
+    parser.add_argument("--max-p95-ms", type=float, default=None,
+                        help="fail if any routed intent's p95 latency exceeds this")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Query plans and latencies of the appointment overlap check and the patient listing
+query, without and with the composite indexes added in
+migrations/versions/20261018_appointment_overlap_indexes.py.
+
+Seeds --rows appointments spread over --doctors doctors and --patients patients
+(SQLite file by default; --database-url to use e.g. a scratch MySQL schema), runs
+each query --queries times with the indexes dropped, then creates them and repeats.
+
+    python -m benchmarks.bench_appointment_indexes --rows 2000000
+"""
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert, select, text
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Base, Appointment, AppointmentStatus
+from benchmarks.bench_agent import percentile
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(2024, 1, 1, 8)
+STATUSES = list(AppointmentStatus)
+
+
+def seed(engine, rows: int, doctors: int, patients: int, batch: int = 20000):
+    rng = random.Random(0)
+    table = Appointment.__table__
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        for offset in range(0, rows, batch):
+            values = []
+            for _ in range(min(batch, rows - offset)):
+                # Half-hour slots over ~3 years of working days
+                start = EPOCH + timedelta(days=rng.randrange(1100), minutes=30 * rng.randrange(18))
+                values.append({
+                    "user_id": rng.randint(1, patients), "doctor_id": rng.randint(1, doctors),
+                    "start_time": start, "end_time": start + timedelta(minutes=30), "reason": "checkup",
+                    "status": rng.choice(STATUSES), "created_at": now, "updated_at": now,
+                })
+            conn.execute(insert(table), values)
+    logger.info(f"Seeded {rows} appointments in {time.perf_counter() - started:.1f}s")
+
+
+def overlap_query(doctor_id: int, start: datetime):
+    # The check AppointmentAgent runs before every booking and reschedule
+    return select(Appointment.id).where(
+        Appointment.doctor_id == doctor_id,
+        Appointment.start_time < start + timedelta(minutes=30),
+        Appointment.end_time > start,
+        Appointment.status != AppointmentStatus.CANCELLED,
+    ).limit(1)
+
+
+def listing_query(user_id: int, since: datetime):
+    return select(Appointment.id).where(
+        Appointment.user_id == user_id,
+        Appointment.status.in_([AppointmentStatus.PENDING, AppointmentStatus.CONFIRMED]),
+        Appointment.start_time >= since,
+    ).order_by(Appointment.start_time)
+
+
+def explain(session, query) -> str:
+    compiled = str(query.compile(session.bind, compile_kwargs={"literal_binds": True}))
+    prefix = "EXPLAIN QUERY PLAN " if session.bind.dialect.name == "sqlite" else "EXPLAIN "
+    return "\n".join("    " + " | ".join(str(v) for v in row) for row in session.execute(text(prefix + compiled)))
+
+
+def measure(session, args, label: str):
+    rng = random.Random(1)
+    for name, make in (("overlap", lambda: overlap_query(rng.randint(1, args.doctors),
+                                                         EPOCH + timedelta(days=rng.randrange(1100), hours=2))),
+                       ("listing", lambda: listing_query(rng.randint(1, args.patients),
+                                                         EPOCH + timedelta(days=rng.randrange(1000))))):
+        logger.info(f"{label} {name} plan:\n{explain(session, make())}")
+        timings = []
+        for _ in range(args.queries):
+            query = make()
+            started = time.perf_counter()
+            session.execute(query).all()
+            timings.append((time.perf_counter() - started) * 1000)
+        logger.info(f"{label} {name}: p50 {percentile(timings, 50):.2f} ms, p95 {percentile(timings, 95):.2f} ms")
+
+
+def run(args):
+    url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'appointments.db')}"
+    engine = create_engine(url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    indexes = [index for index in Appointment.__table__.indexes if index.name.startswith("ix_appointments_")
+               and len(index.columns) > 1]
+    for index in indexes:
+        index.drop(engine)
+    seed(engine, args.rows, args.doctors, args.patients)
+    session = sessionmaker(bind=engine)()
+    measure(session, args, "without indexes")
+    started = time.perf_counter()
+    for index in indexes:
+        index.create(engine)
+    logger.info(f"Created {len(indexes)} composite indexes in {time.perf_counter() - started:.1f}s")
+    if engine.dialect.name == "sqlite":
+        session.execute(text("ANALYZE"))
+    measure(session, args, "with indexes")
+    session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--doctors", type=int, default=200)
+    parser.add_argument("--patients", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--database-url", help="scratch database to use; its tables are dropped and recreated")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Concurrency stress test of the booking service.
+
+--threads workers, each with its own session, book --requests appointments as fast as
+they can on a few doctors and a small pool of 15-minute-aligned, 30-minute-long slots,
+so most requests collide with each other. The run then counts pairs of overlapping
+appointments of the same doctor. --mode unsafe runs the old check-then-insert path
+for comparison. Exits 1 if the booking service let a double-booking through.
+
+    python -m benchmarks.bench_booking --threads 32 --requests 5000
+    python -m benchmarks.bench_booking --mode unsafe
+    python -m benchmarks.bench_booking --database-url mysql+pymysql://root:pw@localhost/booking_stress
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import aliased, sessionmaker
+
+from app.models import Base, Doctor, Appointment, AppointmentStatus
+from app.agent.booking import book_appointment, overlap_criteria, SlotUnavailable, BookingBusy
+from app.metrics import metrics
+from benchmarks.bench_agent import seed, percentile
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+logging.getLogger("app").setLevel(logging.WARNING)
+
+DAY = datetime(2030, 1, 7, 9)
+
+
+def unsafe_book(db, user_id: int, doctor_id: int, start: datetime, end: datetime, reason: str):
+    """The overlap check and insert as separate statements, as writers did before the booking service"""
+    if db.query(Appointment.id).filter(*overlap_criteria(doctor_id, start, end)).first():
+        raise SlotUnavailable(0)
+    db.add(Appointment(user_id=user_id, doctor_id=doctor_id, start_time=start, end_time=end,
+                       reason=reason, status=AppointmentStatus.PENDING))
+    db.commit()
+
+
+def double_bookings(db) -> int:
+    other = aliased(Appointment)
+    return db.query(func.count()).select_from(Appointment).join(other, Appointment.id < other.id).filter(
+        *overlap_criteria(Appointment.doctor_id, other.start_time, other.end_time),
+        other.doctor_id == Appointment.doctor_id,
+        other.status != AppointmentStatus.CANCELLED,
+    ).scalar()
+
+
+def run_mode(mode: str, Session, args, patient_id: int, doctor_ids) -> int:
+    db = Session()
+    db.query(Appointment).delete()
+    db.commit()
+    metrics.reset()
+    outcomes = Counter()
+    latencies = []
+    lock = threading.Lock()
+    remaining = iter(range(args.requests))
+    book = unsafe_book if mode == "unsafe" else book_appointment
+
+    def worker(seed_value: int):
+        rng = random.Random(seed_value)
+        session = Session()
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    break
+            start = DAY + timedelta(minutes=15 * rng.randrange(args.slots))
+            started = time.perf_counter()
+            try:
+                book(session, patient_id, rng.choice(doctor_ids), start, start + timedelta(minutes=30), "stress")
+                outcome = "booked"
+            except SlotUnavailable:
+                outcome = "conflict"
+            except BookingBusy:
+                outcome = "busy"
+            except Exception as e:
+                session.rollback()
+                outcome = f"error ({type(e).__name__})"
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                outcomes[outcome] += 1
+                latencies.append(elapsed)
+        session.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    doubled = double_bookings(db)
+    db.close()
+    logger.info(f"{mode}: {args.requests / elapsed:.0f} requests/s over {args.threads} threads, "
+                f"p50 {percentile(latencies, 50):.1f} ms, p95 {percentile(latencies, 95):.1f} ms")
+    logger.info(f"{mode}: {dict(outcomes)}, retries {metrics.get('booking_retries_total'):.0f}")
+    logger.info(f"{mode}: {doubled} double-booked pairs")
+    return doubled
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--doctors", type=int, default=2, help="how many of the seeded doctors to book")
+    parser.add_argument("--slots", type=int, default=24, help="15-minute start times per doctor")
+    parser.add_argument("--mode", choices=("service", "unsafe", "both"), default="both")
+    parser.add_argument("--database-url", help="scratch database to use; its tables are dropped and recreated")
+    args = parser.parse_args()
+
+    url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'booking.db')}"
+    engine = create_engine(url, pool_size=args.threads, max_overflow=0)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    patient_id = seed(db)
+    doctor_ids = [d.id for d in db.query(Doctor).order_by(Doctor.id).limit(args.doctors)]
+    db.close()
+
+    modes = ("unsafe", "service") if args.mode == "both" else (args.mode,)
+    results = {mode: run_mode(mode, Session, args, patient_id, doctor_ids) for mode in modes}
+    sys.exit(1 if results.get("service") else 0)
+
+
+if __name__ == "__main__":
+    main()
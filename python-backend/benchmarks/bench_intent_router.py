@@ -0,0 +1,169 @@
+"""
+Micro-benchmark for the agent intent router.
+
+Compares the precompiled single-pass router against the original cascade of
+sequential re.search calls, and checks both classify every corpus phrase the same way.
+Intents the cascade never had are checked against ADDED_CORPUS instead.
+
+    python -m benchmarks.bench_intent_router --iterations 2000
+"""
+import argparse
+import re
+import sys
+import time
+import logging
+
+from app.agent.intent_router import intent_router, FALLBACK
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CORPUS = [
+    "hi",
+    "what can you do?",
+    "how do I book an appointment",
+    "create user john doe with email john@example.com and role PATIENT",
+    "delete user 12",
+    "list users",
+    "show all users please",
+    "add doctor john smith with specialization cardiology, license MD123, user 4",
+    "delete doctor 3",
+    "list doctors",
+    "delete appointment 7",
+    "list appointments",
+    "show appointments",
+    "reschedule appointment 5 to 2025-06-01 14:30",
+    "change appointment 5 to tomorrow at 4pm",
+    "rescheduling appointment 9 to 3 June 10am",
+    "show my upcoming appointments",
+    "what are my cancelled appointments",
+    "my appointments",
+    "cancel my appointment with Dr. Smith tomorrow",
+    "delete my appointment with dr john smith on 12/06/2025",
+    "cancel my appointment with dr smith",
+    "reschedule my appointment with Dr. Smith to Friday 3pm",
+    "reschedule my appointment to 5 pm",
+    "Book an appointment with Dr. John Smith on 2025-06-01 at 3pm for a checkup",
+    "I want to book with Dr Smith tomorrow at 10 am for fever",
+    "Please schedule me with Dr. Patel today 11:30 for back pain",
+    "make an appointment with Dr. Rao on 5th June 2025 at 9",
+    "book an appointment with dr smith",
+    "Can I see a doctor tomorrow?",
+    "I need to schedule an appointment with Dr. Smith for tomorrow afternoon",
+    "thanks, that's all",
+    "Book an appointment with Dr. Smith on Monday at 3pm if he is available",
+    "Schedule me with Dr. Patel tomorrow at 10am, any free slots are fine",
+    "Is a doctor available tomorrow?",
+    "are there any openings this week?",
+    "Are any doctors available today?",
+    "Which doctors are available on Friday?",
+    "any doctors free on Monday?",
+    "is dr a available tomorrow?",
+]
+
+# Intents added after the legacy cascade, which sent these messages to the LLM fallback
+ADDED_CORPUS = [
+    ("When is Dr. Smith available?", "doctor_availability"),
+    ("is dr smith free tomorrow", "doctor_availability"),
+    ("Show Dr. John Smith's availability on Monday", "doctor_availability"),
+    ("any open slots with doctor Patel next week?", "doctor_availability"),
+    ("What openings does Dr Rao have on 12/06/2025?", "doctor_availability"),
+    ("Is Dr. J Smith available on Monday?", "doctor_availability"),
+]
+
+
+def legacy_classify(message: str) -> str:
+    """The original process_message cascade, reduced to the intent it would pick"""
+    msg = message.lower()
+    if re.search(r"create user|add user|register user", msg):
+        if re.search(r"user ([a-zA-Z]+) ([a-zA-Z]+) with email ([^ ]+) and role ([A-Z]+)", msg):
+            return "create_user"
+    if re.search(r"delete user", msg):
+        if re.search(r"delete user (\d+)", msg):
+            return "delete_user"
+    if re.search(r"list users|show users|all users", msg):
+        return "list_users"
+    if re.search(r"create doctor|add doctor", msg):
+        if re.search(r"doctor ([a-zA-Z]+) ([a-zA-Z]+) with specialization ([^,]+), license ([^ ]+), user (\d+)", msg):
+            return "create_doctor"
+    if re.search(r"delete doctor", msg):
+        if re.search(r"delete doctor (\d+)", msg):
+            return "delete_doctor"
+    if re.search(r"list doctors|show doctors|all doctors", msg):
+        return "list_doctors"
+    if re.search(r"delete appointment", msg):
+        if re.search(r"delete appointment (\d+)", msg):
+            return "delete_appointment"
+    if re.search(r"list appointments|show appointments|all appointments", msg):
+        return "list_all_appointments"
+    if re.search(r"reschedule appointment", msg):
+        if re.search(r"reschedule appointment (\d+) to (\d{4}-\d{2}-\d{2}) (\d{1,2}):(\d{2})", msg):
+            return "reschedule_appointment"
+    if re.search(r'(?:change|reschedul(?:e|ing|ed|ule|uled|uling|ul|ule)?) appointment (\d+) to ([^\n]+)', msg, re.IGNORECASE):
+        return "change_appointment"
+    if re.search(r"(show|list|display|what are|which are|my|all)? ?(upcoming|current|future|pending|confirmed|cancelled|completed)? ?appointments", msg):
+        return "list_appointments"
+    if re.search(r"(delete|cancel) my appointment with dr\.?\s*([A-Za-z]+)(?:\s+([A-Za-z]+))?(?: of| for| on| at)? ([^\n]*)", msg, re.IGNORECASE):
+        return "cancel_appointment"
+    if re.search(r"reschedul(?:e|ing|ed|ule|uled|uling|ul|ule)? (?:my )?appointment(?: with dr\.?\s*([A-Za-z]+)(?:\s+([A-Za-z]+))?)?(?: for| to| on| at)? ([^\n]+)", msg, re.IGNORECASE):
+        return "reschedule_my_appointment"
+    booking_match = re.search(r"book|schedule|make an appointment", message, re.IGNORECASE)
+    doctor_match = re.search(r"Dr\.?\s*([A-Za-z]+)(?:\s+([A-Za-z]+))?", message)
+    date_match = re.search(r"on ([^,]+)", message, re.IGNORECASE)
+    if not date_match:
+        date_match = re.search(r"today|tomorrow|\d{4}-\d{2}-\d{2}|\d{1,2}/\d{1,2}/\d{2,4}|\d{1,2}(?:st|nd|rd|th)? [A-Za-z]+ \d{4}", message, re.IGNORECASE)
+    time_match = re.search(r"(\d{1,2})(?::(\d{2}))?\s*(a\.m\.|am|p\.m\.|pm)?", message, re.IGNORECASE)
+    re.search(r"for (.+?)(?= with dr| with doctor| tomorrow| today| at | on | by | for | in | from | am| pm| a\.m\.| p\.m\.|$)", message, re.IGNORECASE)
+    if booking_match and doctor_match and date_match and time_match:
+        return "book_appointment"
+    return FALLBACK
+
+
+def check_equivalence(corpus) -> int:
+    mismatches = 0
+    for message in corpus:
+        expected = legacy_classify(message)
+        actual = intent_router.classify(message).name
+        if expected != actual:
+            mismatches += 1
+            logger.error(f"Mismatch for {message!r}: legacy={expected} router={actual}")
+    return mismatches
+
+
+def check_added(corpus) -> int:
+    mismatches = 0
+    for message, expected in corpus:
+        actual = intent_router.classify(message).name
+        if expected != actual:
+            mismatches += 1
+            logger.error(f"Mismatch for {message!r}: expected={expected} router={actual}")
+    return mismatches
+
+
+def time_classifier(fn, corpus, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for message in corpus:
+            fn(message)
+    return (time.perf_counter() - started) / (iterations * len(corpus))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    mismatches = check_equivalence(CORPUS) + check_added(ADDED_CORPUS)
+    # Warm the re module cache so the legacy path is measured at its best
+    time_classifier(legacy_classify, CORPUS, 10)
+    legacy = time_classifier(legacy_classify, CORPUS, args.iterations)
+    router = time_classifier(intent_router.classify, CORPUS, args.iterations)
+    logger.info(f"Corpus: {len(CORPUS)} messages x {args.iterations} iterations, plus {len(ADDED_CORPUS)} for added intents")
+    logger.info(f"Legacy cascade: {legacy * 1e6:.2f} us/message")
+    logger.info(f"Intent router:  {router * 1e6:.2f} us/message ({legacy / router:.1f}x)")
+    logger.info(f"Classification mismatches: {mismatches}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
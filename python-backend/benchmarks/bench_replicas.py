@@ -0,0 +1,70 @@
+"""
+Throughput of concurrent LLM fallbacks: in-process model vs. out-of-process replicas.
+
+Sends --requests concurrent free-form messages through AppointmentAgent with FakeLlama
+as the model, first in-process (every call serialized by the model lock) and then with
+LLM_MODE=service-style replica processes, and reports requests/second for each.
+
+    python -m benchmarks.bench_replicas --replicas 4 --requests 16
+"""
+import argparse
+import asyncio
+import time
+import logging
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models import Base
+from app.agent import model_registry
+from app.agent.appointment_agent import AppointmentAgent
+from app.agent.inference_scheduler import InferenceScheduler, set_scheduler
+from app.agent.llm_service import ReplicaPool
+from app.agent.response_cache import response_cache
+from benchmarks.bench_agent import seed
+from benchmarks.fakes import FakeLlama
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+logging.getLogger("app").setLevel(logging.WARNING)
+
+
+async def drive(db, patient_id: int, requests: int) -> float:
+    response_cache.clear()
+    started = time.perf_counter()
+    # Distinct messages so the reply cache does not coalesce them
+    await asyncio.gather(*[AppointmentAgent(db).process_message(f"question number {i}", patient_id)
+                           for i in range(requests)])
+    return requests / (time.perf_counter() - started)
+
+
+async def run(args):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    patient_id = seed(db)
+    results = {}
+    for label, llm, workers in (("in-process", FakeLlama(), 1),
+                                (f"{args.replicas} replicas", ReplicaPool(args.replicas, FakeLlama).start(),
+                                 args.replicas)):
+        model_registry.set_llm(llm)
+        scheduler = InferenceScheduler(workers=workers, max_queue=args.requests * 2)
+        set_scheduler(scheduler)
+        results[label] = await drive(db, patient_id, args.requests)
+        scheduler.shutdown()
+        if getattr(llm, "remote", False):
+            llm.shutdown()
+    for label, throughput in results.items():
+        logger.info(f"{label:<14} {throughput:6.2f} requests/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replicas", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=16)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
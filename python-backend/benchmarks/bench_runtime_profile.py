@@ -0,0 +1,88 @@
+"""
+Tuning sweep for the llama.cpp runtime profile on the current host.
+
+Loads the model once per (n_threads, n_batch) combination from the configured
+profile, measures prompt-processing and generation speed on the agent's own
+prompt, and prints the combinations ranked by the latency of a typical fallback
+reply. --write saves the best profile as JSON for LLM_PROFILE_FILE.
+
+Needs llama-cpp-python and the GGUF model (see MISTRAL_MODEL_PATH).
+
+    python -m benchmarks.bench_runtime_profile --threads 2 4 8 --batch 128 512
+    python -m benchmarks.bench_runtime_profile --write llm_profile.json
+"""
+import argparse
+import dataclasses
+import os
+import sys
+import time
+import logging
+
+from app.agent.appointment_agent import AppointmentAgent
+from app.agent.model_registry import Llama, get_profile
+from app.agent.runtime_profile import validate
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PROMPT = AppointmentAgent.prompt.format(message="Do I need to fast before a blood test next week?")
+
+
+def measure(profile, generate_tokens: int):
+    llm = Llama(**profile.llama_kwargs(), verbose=False)
+    prompt_tokens = llm.tokenize(PROMPT.encode("utf-8"))
+    started = time.perf_counter()
+    llm.reset()
+    llm.eval(prompt_tokens)
+    prompt_seconds = time.perf_counter() - started
+    # The prompt is already evaluated, so this call only generates
+    started = time.perf_counter()
+    output = llm(PROMPT, max_tokens=generate_tokens, temperature=0.0)
+    generation_seconds = time.perf_counter() - started
+    generated = output["usage"]["completion_tokens"] or 1
+    del llm
+    return len(prompt_tokens), len(prompt_tokens) / prompt_seconds, generated / generation_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    cores = os.cpu_count() or 1
+    parser.add_argument("--threads", type=int, nargs="+",
+                        default=sorted({t for t in (1, 2, 4, 6, 8, 12, 16, cores // 2, cores) if 1 <= t <= cores}))
+    parser.add_argument("--batch", type=int, nargs="+", default=[64, 256, 512])
+    parser.add_argument("--generate", type=int, default=64, help="tokens generated per measurement")
+    parser.add_argument("--reply-tokens", type=int, default=128, help="reply length used to rank profiles")
+    parser.add_argument("--write", help="save the fastest profile to this JSON file")
+    args = parser.parse_args()
+
+    if Llama is None:
+        logger.error("llama-cpp-python is required for the runtime profile sweep")
+        sys.exit(1)
+    base = get_profile()
+    if not os.path.exists(base.model_path):
+        logger.error(f"Model not found at {base.model_path}; set MISTRAL_MODEL_PATH")
+        sys.exit(1)
+
+    results = []
+    for threads in args.threads:
+        for batch in args.batch:
+            profile = dataclasses.replace(base, n_threads=threads, n_threads_batch=threads, n_batch=batch)
+            validate(profile)
+            prompt_tokens, prompt_rate, generation_rate = measure(profile, args.generate)
+            # Without the prefix cache the whole prompt is evaluated, then the reply is generated
+            latency = prompt_tokens / prompt_rate + args.reply_tokens / generation_rate
+            results.append((latency, profile, prompt_rate, generation_rate))
+            logger.info(f"threads={threads:<3} batch={batch:<5} prompt {prompt_rate:7.1f} tok/s"
+                        f"  generation {generation_rate:6.2f} tok/s  reply ~{latency:.2f}s")
+
+    results.sort(key=lambda r: r[0])
+    best = results[0][1]
+    logger.info(f"Fastest on this host: n_threads={best.n_threads} n_batch={best.n_batch} (~{results[0][0]:.2f}s per reply)")
+    if args.write:
+        with open(args.write, "w") as f:
+            f.write(best.to_json())
+        logger.info(f"Wrote {args.write}; set LLM_PROFILE_FILE={args.write} to use it")
+
+
+if __name__ == "__main__":
+    main()
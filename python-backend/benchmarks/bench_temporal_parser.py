@@ -0,0 +1,131 @@
+"""
+Benchmark for the agent's temporal-expression parser.
+
+Compares accuracy and throughput of app.agent.temporal.parse_temporal against the
+previous path (fuzzy, day-first dateutil with "today"/"tomorrow" special cases) on a
+corpus of scheduling phrases with known answers, relative to a fixed reference date.
+
+    python -m benchmarks.bench_temporal_parser --iterations 500
+"""
+import argparse
+import time
+import logging
+from datetime import date, datetime, timedelta
+from datetime import time as clock
+
+from dateutil import parser as date_parser
+
+from app.agent import temporal
+from app.agent.temporal import parse_temporal
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# A Monday, so weekday phrases have unambiguous answers
+REFERENCE = date(2025, 6, 2)
+
+# (phrase, expected date, expected time); None means the phrase does not give that part
+CORPUS = [
+    ("tomorrow", date(2025, 6, 3), None),
+    ("today at 4pm", date(2025, 6, 2), clock(16, 0)),
+    ("tomorrow at 10 am", date(2025, 6, 3), clock(10, 0)),
+    ("day after tomorrow 9:15", date(2025, 6, 4), clock(9, 15)),
+    ("2025-06-10", date(2025, 6, 10), None),
+    ("2025-06-10 14:30", date(2025, 6, 10), clock(14, 30)),
+    ("2025-07-01 at 3pm", date(2025, 7, 1), clock(15, 0)),
+    ("12/06/2025", date(2025, 6, 12), None),
+    ("12/06/2025 at 11:00", date(2025, 6, 12), clock(11, 0)),
+    ("5th June 2025 at 9", date(2025, 6, 5), clock(9, 0)),
+    ("21st of July", date(2025, 7, 21), None),
+    ("June 20th, 2025 at 2:45 pm", date(2025, 6, 20), clock(14, 45)),
+    ("the 15th", date(2025, 6, 15), None),
+    ("friday", date(2025, 6, 6), None),
+    ("Friday 3pm", date(2025, 6, 6), clock(15, 0)),
+    ("next monday", date(2025, 6, 9), None),
+    ("next Wednesday at 11:30", date(2025, 6, 4), clock(11, 30)),
+    ("this thursday afternoon", date(2025, 6, 5), clock(14, 0)),
+    ("in 3 days", date(2025, 6, 5), None),
+    ("in two weeks", date(2025, 6, 16), None),
+    ("in a week at 9am", date(2025, 6, 9), clock(9, 0)),
+    ("next week", date(2025, 6, 9), None),
+    ("tomorrow afternoon", date(2025, 6, 3), clock(14, 0)),
+    ("tomorrow morning", date(2025, 6, 3), clock(9, 0)),
+    ("this evening", date(2025, 6, 2), clock(18, 0)),
+    ("tonight", date(2025, 6, 2), clock(19, 0)),
+    ("at 3 in the afternoon", None, clock(15, 0)),
+    ("5 pm", None, clock(17, 0)),
+    ("10:30", None, clock(10, 30)),
+    ("17:45", None, clock(17, 45)),
+    ("noon", None, clock(12, 0)),
+    ("12 am", None, clock(0, 0)),
+    ("3 p.m.", None, clock(15, 0)),
+    ("Friday at noon", date(2025, 6, 6), clock(12, 0)),
+    ("sometime around 4:00 on 30/06/2025", date(2025, 6, 30), clock(4, 0)),
+    ("Dec 1st 2025 at 8 am", date(2025, 12, 1), clock(8, 0)),
+]
+
+
+def legacy_parse(text: str):
+    """The handlers' previous logic: special-cased words, then fuzzy day-first dateutil"""
+    lowered = text.lower()
+    if lowered == "tomorrow":
+        return (datetime.combine(REFERENCE, clock(0, 0)) + timedelta(days=1)).date(), None
+    if lowered == "today":
+        return REFERENCE, None
+    try:
+        parsed = date_parser.parse(text, fuzzy=True, dayfirst=True,
+                                   default=datetime.combine(REFERENCE, clock(0, 0)))
+    except (ValueError, OverflowError):
+        return None, None
+    # The handlers could not tell a missing part from midnight/today, so compare loosely
+    return parsed.date(), parsed.time()
+
+
+def new_parse(text: str):
+    result = parse_temporal(text, REFERENCE)
+    return (result.date, result.time) if result else (None, None)
+
+
+def score(fn) -> int:
+    correct = 0
+    for phrase, expected_date, expected_time in CORPUS:
+        actual_date, actual_time = fn(phrase)
+        date_ok = expected_date is None or actual_date == expected_date
+        time_ok = (actual_time or clock(0, 0)) == (expected_time or clock(0, 0))
+        if date_ok and time_ok:
+            correct += 1
+        elif fn is new_parse:
+            logger.error(f"Wrong parse for {phrase!r}: {actual_date} {actual_time}")
+    return correct
+
+
+def time_parser(fn, iterations: int, clear=None) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        if clear:
+            clear()
+        for phrase, _, _ in CORPUS:
+            fn(phrase)
+    return (time.perf_counter() - started) / (iterations * len(CORPUS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+
+    legacy_correct = score(legacy_parse)
+    new_correct = score(new_parse)
+    legacy = time_parser(legacy_parse, args.iterations)
+    cold = time_parser(new_parse, args.iterations, clear=temporal._parse.cache_clear)
+    warm = time_parser(new_parse, args.iterations)
+    logger.info(f"Corpus: {len(CORPUS)} phrases x {args.iterations} iterations, reference {REFERENCE}")
+    logger.info(f"Accuracy: dateutil {legacy_correct}/{len(CORPUS)}, temporal parser {new_correct}/{len(CORPUS)}")
+    logger.info(f"dateutil path:           {legacy * 1e6:.2f} us/phrase")
+    logger.info(f"temporal parser (cold):  {cold * 1e6:.2f} us/phrase ({legacy / cold:.1f}x)")
+    logger.info(f"temporal parser (memo):  {warm * 1e6:.2f} us/phrase ({legacy / warm:.1f}x)")
+    logger.info(f"Memo cache: {temporal.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
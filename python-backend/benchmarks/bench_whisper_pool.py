@@ -0,0 +1,84 @@
+"""
+Throughput of concurrent voice clips through the transcription pool: one clip per
+Whisper call vs. batched passes.
+
+Submits --clips concurrent clips of --seconds of audio, first with batches of one
+(the old one-transcribe-per-request behaviour) and then with batches of up to
+--batch-size, and reports clips/second for each. --random-init builds the model
+with random weights instead of downloading it, which is enough to time the passes.
+
+    python -m benchmarks.bench_whisper_pool --model tiny --clips 8 --batch-size 8
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+import numpy as np
+
+from app.speech import whisper_registry
+from app.speech.audio import SAMPLE_RATE
+from app.speech.transcription_pool import TranscriptionPool
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+logging.getLogger("app").setLevel(logging.WARNING)
+
+# whisper.model.ModelDimensions of the released checkpoints
+_DIMS = {
+    "tiny": (384, 6, 4),
+    "base": (512, 8, 6),
+    "small": (768, 12, 12),
+}
+
+
+def random_model(size: str):
+    import torch
+    from whisper.model import Whisper, ModelDimensions
+    state, heads, layers = _DIMS[size]
+    torch.manual_seed(0)
+    dims = ModelDimensions(n_mels=80, n_audio_ctx=1500, n_audio_state=state, n_audio_head=heads,
+                           n_audio_layer=layers, n_vocab=51865, n_text_ctx=448, n_text_state=state,
+                           n_text_head=heads, n_text_layer=layers)
+    return Whisper(dims).eval()
+
+
+async def drive(pool: TranscriptionPool, clips) -> float:
+    started = time.perf_counter()
+    await asyncio.gather(*(pool.transcribe(clip, "en") for clip in clips))
+    return len(clips) / (time.perf_counter() - started)
+
+
+async def run(args):
+    if args.random_init:
+        model = random_model(args.model)
+    else:
+        import whisper
+        model = whisper.load_model(args.model)
+    whisper_registry.set_whisper_model(model)
+    rng = np.random.default_rng(0)
+    clips = [(0.05 * rng.standard_normal(int(args.seconds * SAMPLE_RATE))).astype(np.float32)
+             for _ in range(args.clips)]
+    results = {}
+    for label, batch_size in (("one per call", 1), (f"batches of {args.batch_size}", args.batch_size)):
+        pool = TranscriptionPool(workers=1, batch_size=batch_size, window=args.window_ms / 1000,
+                                 max_queue=args.clips)
+        results[label] = await drive(pool, clips)
+        pool.shutdown()
+    for label, throughput in results.items():
+        logger.info(f"{label:<14} {throughput:6.2f} clips/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="tiny", choices=sorted(_DIMS))
+    parser.add_argument("--random-init", action="store_true", help="random weights instead of the released checkpoint")
+    parser.add_argument("--clips", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--window-ms", type=float, default=20)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
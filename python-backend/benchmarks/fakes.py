@@ -0,0 +1,58 @@
+"""
+Stand-in model backends for benchmarks. They mimic the call shapes the app uses
+(llama_cpp.Llama and a loaded Whisper model) and sleep for a configurable time
+instead of running inference, so agent overheads can be measured on their own.
+"""
+import threading
+import time
+from typing import Optional
+
+
+class FakeLlama:
+    """
+    llama_cpp.Llama look-alike: fixed reply, prompt-processing latency plus per-token latency.
+    Calls that pass a grammar get structured_reply instead, as grammar-constrained output.
+    """
+
+    def __init__(self, reply: str = "I can help you book, reschedule or cancel appointments.",
+                 prompt_latency: float = 0.05, token_latency: float = 0.01,
+                 structured_reply: str = '{"intent": "other", "doctor": null, "date": null, "time": null, '
+                                         '"reason": null, "appointment_id": null}'):
+        self.reply = reply
+        self.structured_reply = structured_reply
+        self.prompt_latency = prompt_latency
+        self.token_latency = token_latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _tokens(self, text: str, max_tokens: int):
+        return [word + " " for word in text.split()][:max_tokens]
+
+    def __call__(self, prompt: str, max_tokens: int = 256, stream: bool = False, **kwargs):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.prompt_latency)
+        tokens = self._tokens(self.structured_reply if "grammar" in kwargs else self.reply, max_tokens)
+        if stream:
+            return self._stream(tokens)
+        time.sleep(self.token_latency * len(tokens))
+        return {"choices": [{"text": "".join(tokens).strip()}]}
+
+    def _stream(self, tokens):
+        for token in tokens:
+            time.sleep(self.token_latency)
+            yield {"choices": [{"text": token}]}
+
+
+class FakeWhisper:
+    """Whisper model look-alike: "transcribes" by returning the text it is given, after a delay"""
+
+    def __init__(self, latency: float = 0.3, text: Optional[str] = None):
+        self.latency = latency
+        self.text = text
+        self.calls = 0
+
+    def transcribe(self, audio, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        return {"text": self.text if self.text is not None else str(audio)}
@@ -0,0 +1,30 @@
+"""
+Revision ID: 20261018_appointment_overlap_indexes
+Revises: 20240524_appointment_status_enum
+Create Date: 2026-10-18
+
+This migration adds composite indexes to the 'appointments' table: (doctor_id, start_time, end_time) for the
+overlap check run on every booking and reschedule, and (user_id, status, start_time) for listing a patient's
+appointments by status and date.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20261018_appointment_overlap_indexes'
+down_revision = '20240524_appointment_status_enum'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_index('ix_appointments_doctor_start_end', 'appointments', ['doctor_id', 'start_time', 'end_time'])
+    op.create_index('ix_appointments_user_status_start', 'appointments', ['user_id', 'status', 'start_time'])
+
+def downgrade():
+    # On MySQL the composite indexes can be the ones backing the doctor_id and user_id foreign
+    # keys (InnoDB drops its implicit FK index once a usable one exists), and dropping an index
+    # a foreign key needs fails with error 1553. Give the keys plain indexes first.
+    op.create_index('ix_appointments_doctor_id', 'appointments', ['doctor_id'])
+    op.create_index('ix_appointments_user_id', 'appointments', ['user_id'])
+    op.drop_index('ix_appointments_user_status_start', table_name='appointments')
+    op.drop_index('ix_appointments_doctor_start_end', table_name='appointments')
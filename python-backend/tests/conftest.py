@@ -0,0 +1,27 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# The routers open app.database at import; tests use their own in-memory engines
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app.models import Base, User, UserRole, Doctor
+
+
+@pytest.fixture
+def db():
+    """A session on an empty in-memory database with doctor 1 (user 1, John Smith) and patient user 2"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    user = User(email="doctor@example.com", password="x", first_name="John", last_name="Smith", role=UserRole.DOCTOR)
+    session.add(user)
+    session.flush()
+    session.add(Doctor(user_id=user.id, specialization="General", license_number="LIC0"))
+    session.add(User(email="patient@example.com", password="x", first_name="Jane", last_name="Doe"))
+    session.commit()
+    yield session
+    session.close()
@@ -0,0 +1,47 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.agent.availability import free_slots, find_availability
+from app.agent.booking import book_appointment
+from app.auth import get_current_user
+from app.models import User, AppointmentStatus
+from app.routers import doctors
+
+MONDAY = datetime(2030, 1, 7)
+
+
+def starts(db, day: datetime):
+    return [s.start for s in find_availability(db, 1, day, day + timedelta(days=1), now=day)]
+
+
+def test_cancelled_appointment_frees_its_slot(db):
+    ten = MONDAY.replace(hour=10)
+    appointment = book_appointment(db, 2, 1, ten, ten + timedelta(minutes=30), "checkup")
+    assert ten not in starts(db, MONDAY)
+
+    appointment.status = AppointmentStatus.CANCELLED
+    db.commit()
+    assert ten in starts(db, MONDAY)
+    book_appointment(db, 2, 1, ten, ten + timedelta(minutes=30), "checkup")
+    assert ten not in starts(db, MONDAY)
+
+
+@pytest.mark.parametrize("limit", [0, -3])
+def test_free_slots_without_room_for_any(limit):
+    assert free_slots([], MONDAY, MONDAY + timedelta(days=1), limit=limit) == []
+
+
+@pytest.mark.parametrize("limit, status", [(0, 422), (-1, 422), (100000, 422), (3, 200)])
+def test_availability_limit_is_bounded(db, limit, status):
+    app = FastAPI()
+    app.include_router(doctors.router, prefix="/doctors")
+    app.dependency_overrides[doctors.get_db] = lambda: db
+    app.dependency_overrides[get_current_user] = lambda: db.get(User, 2)
+    day = date.today() + timedelta(days=7 - date.today().weekday())
+    response = TestClient(app).get("/doctors/1/availability", params={"start": day.isoformat(), "limit": limit})
+    assert response.status_code == status
+    if status == 200:
+        assert len(response.json()["slots"]) == 3
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.agent.booking import book_appointment, set_status, SlotUnavailable
+from app.auth import get_current_user
+from app.models import User, AppointmentStatus
+from app.routers import appointments
+
+TEN = datetime(2030, 1, 7, 10)
+HALF_HOUR = timedelta(minutes=30)
+
+
+def test_reactivating_a_cancelled_appointment_over_a_new_booking_conflicts(db):
+    old = book_appointment(db, 2, 1, TEN, TEN + HALF_HOUR, "checkup")
+    set_status(db, old, AppointmentStatus.CANCELLED)
+    book_appointment(db, 2, 1, TEN, TEN + HALF_HOUR, "follow-up")
+    with pytest.raises(SlotUnavailable):
+        set_status(db, old, AppointmentStatus.CONFIRMED)
+    db.refresh(old)
+    assert old.status == AppointmentStatus.CANCELLED
+
+
+def test_reactivating_a_cancelled_appointment_with_a_free_slot(db):
+    appointment = book_appointment(db, 2, 1, TEN, TEN + HALF_HOUR, "checkup")
+    set_status(db, appointment, AppointmentStatus.CANCELLED)
+    assert set_status(db, appointment, AppointmentStatus.PENDING).status == AppointmentStatus.PENDING
+
+
+def test_put_cannot_reactivate_into_a_taken_slot(db):
+    app = FastAPI()
+    app.include_router(appointments.router, prefix="/appointments")
+    app.dependency_overrides[appointments.get_db] = lambda: db
+    app.dependency_overrides[get_current_user] = lambda: db.get(User, 2)
+    client = TestClient(app)
+    old = book_appointment(db, 2, 1, TEN, TEN + HALF_HOUR, "checkup")
+    assert client.put(f"/appointments/{old.id}", json={"status": "CANCELLED"}).status_code == 200
+    book_appointment(db, 2, 1, TEN, TEN + HALF_HOUR, "follow-up")
+
+    response = client.put(f"/appointments/{old.id}", json={"status": "PENDING", "reason": "changed my mind"})
+    assert response.status_code == 409
+    assert client.put(f"/appointments/{old.id}", json={"reason": "noted"}).status_code == 200
+    assert client.put(f"/appointments/{old.id}", json={"status": "BOGUS"}).status_code == 400
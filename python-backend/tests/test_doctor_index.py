@@ -0,0 +1,33 @@
+import pytest
+
+from app.agent.doctor_index import DoctorIndex
+from app.models import User, UserRole, Doctor
+
+
+@pytest.fixture
+def index(db):
+    user = User(email="shaw@example.com", password="x", first_name="Ann", last_name="Shaw", role=UserRole.DOCTOR)
+    db.add(user)
+    db.flush()
+    db.add(Doctor(user_id=user.id, specialization="Dermatology", license_number="LIC1"))
+    db.commit()
+    index = DoctorIndex()
+    index.load(db)
+    return index
+
+
+@pytest.mark.parametrize("first, last, expected", [
+    ("Smith", None, "Smith"),
+    ("Smyth", None, "Smith"),
+    ("Shawe", None, "Shaw"),
+    ("Jon", "Smyth", "Smith"),
+    ("J", "Smith", "Smith"),
+    ("Smith", "to", "Smith"),
+])
+def test_resolves_names_and_variants(index, first, last, expected):
+    assert index.resolve(first, last).last_name == expected
+
+
+@pytest.mark.parametrize("first, last", [("s", None), ("sh", None), ("a", None), ("s", "x"), ("dr", "a")])
+def test_fragments_resolve_to_nobody(index, first, last):
+    assert index.resolve(first, last) is None
@@ -0,0 +1,31 @@
+import pytest
+
+from app.agent.intent_router import intent_router, FALLBACK
+
+
+@pytest.mark.parametrize("message", [
+    "Are any doctors available today?",
+    "Which doctors are available on Friday?",
+    "any doctors free on Monday?",
+    "is dr a available tomorrow?",
+    "Is a doctor available tomorrow?",
+])
+def test_availability_without_a_doctor_name_falls_back(message):
+    assert intent_router.classify(message).name == FALLBACK
+
+
+@pytest.mark.parametrize("message, first, last", [
+    ("When is Dr. Smith available?", "Smith", None),
+    ("Show Dr. John Smith's availability on Monday", "John", "Smith"),
+    ("Is Dr. J Smith available on Monday?", "J", "Smith"),
+    ("which doctors is dr shaw free on monday", "shaw", None),
+])
+def test_availability_names_the_doctor(message, first, last):
+    intent = intent_router.classify(message)
+    assert intent.name == "doctor_availability"
+    assert (intent.slots["doctor_first"], intent.slots["doctor_last"]) == (first, last)
+
+
+def test_booking_that_mentions_availability_books():
+    intent = intent_router.classify("Book an appointment with Dr. Smith on Monday at 3pm if he is available")
+    assert intent.name == "book_appointment"
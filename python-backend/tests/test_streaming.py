@@ -0,0 +1,47 @@
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.speech import whisper_registry
+from app.speech.streaming import _transcribe
+from benchmarks.fakes import FakeWhisper
+from tests.test_vad import noise, speech
+
+
+@pytest.fixture(scope="module")
+def model():
+    # Pool workers keep the model they first get, so the module shares one stand-in
+    fake = FakeWhisper(latency=0, text="book dr smith tomorrow")
+    for size in whisper_registry.tiers():
+        whisper_registry.set_whisper_model(fake, size)
+    return fake
+
+
+def test_silent_stream_tail_never_reaches_the_model(model):
+    calls = model.calls
+    assert asyncio.run(_transcribe(noise(-35, 1))) == ""
+    assert model.calls == calls
+
+
+def test_stream_speech_is_transcribed(model):
+    calls = model.calls
+    assert asyncio.run(_transcribe(np.concatenate([noise(-50, 0.5), speech(1.5)]))) == "book dr smith tomorrow"
+    assert model.calls == calls + 1
+
+
+def test_batch_drops_segments_whisper_judges_silent():
+    torch = pytest.importorskip("torch")
+    pytest.importorskip("whisper")
+
+    class BatchModel:
+        dims = SimpleNamespace(n_mels=80)
+        device = torch.device("cpu")
+
+        def decode(self, mels, options):
+            return [SimpleNamespace(text=" Thank you.", language="en", avg_logprob=-0.3, no_speech_prob=0.9),
+                    SimpleNamespace(text=" Cancel it.", language="en", avg_logprob=-0.2, no_speech_prob=0.1)]
+
+    results = whisper_registry.transcribe_batch(BatchModel(), [np.zeros(16000, dtype=np.float32)] * 2)
+    assert [r["text"] for r in results] == ["", " Cancel it."]
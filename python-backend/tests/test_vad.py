@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from app.speech.audio import SAMPLE_RATE
+from app.speech.vad import NoSpeechDetected, preprocess
+
+
+def noise(level_db: float, seconds: float) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return (10 ** (level_db / 20) * rng.standard_normal(int(seconds * SAMPLE_RATE))).astype(np.float32)
+
+
+def speech(seconds: float) -> np.ndarray:
+    """A voiced tone with a 4 Hz syllable envelope"""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return ((0.5 + 0.5 * np.sin(2 * np.pi * 4 * t)) * 0.2 * np.sin(2 * np.pi * 180 * t)).astype(np.float32)
+
+
+@pytest.mark.parametrize("level_db", [-35, -25])
+def test_noise_only_clip_has_no_speech(level_db):
+    with pytest.raises(NoSpeechDetected):
+        preprocess(noise(level_db, 5))
+
+
+def test_speech_in_noise_is_trimmed():
+    silence = np.zeros(SAMPLE_RATE, dtype=np.float32)
+    clip = np.concatenate([silence, speech(2), silence]) + noise(-35, 4)
+    result = preprocess(clip)
+    assert len(result.segments) == 1
+    assert 1.8 < result.speech_seconds < 2.6
+    assert result.saved_seconds > 1.4
+
+
+def test_clip_that_is_all_speech_is_kept():
+    result = preprocess(speech(3))
+    assert result.speech_seconds == pytest.approx(3, abs=0.05)